@@ -3,15 +3,20 @@ Admin API endpoints.
 Handles system statistics, model management, and database monitoring.
 """
 
-from fastapi import APIRouter, HTTPException, Query, status, BackgroundTasks
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request, status, BackgroundTasks
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel
 from datetime import datetime, timedelta
+import asyncio
+import logging
 
 from app.database import (
-    Database, Collections,
+    Database, get_collections, fast_count,
     SystemStats, GenreStats, TypeStats, ModelResponse
 )
+from app.utils import async_ttl_cache, etag_response
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -40,6 +45,13 @@ class TrainingState(BaseModel):
     model_name: Optional[str] = None
 
 
+# Fields needed to build a ModelResponse
+MODEL_PROJECTION = {
+    "_id": 0, "model_name": 1, "rmse": 1, "mae": 1, "precision_k": 1,
+    "recall_k": 1, "f1_k": 1, "ndcg_k": 1, "trained_at": 1, "description": 1
+}
+
+
 # Global state for training progress
 current_training_state = TrainingState()
 
@@ -50,42 +62,63 @@ async def update_progress(message: str, progress: int):
     current_training_state.progress = progress
     if progress >= 100:
         current_training_state.status = "completed"
+        # Fresh metrics were just written, drop the cached model list
+        _load_models.cache_clear()
     elif message.startswith("Error"):
         current_training_state.status = "error"
 
 
 @router.get("/stats", response_model=SystemStats)
-async def get_system_stats():
+async def get_system_stats(
+    request: Request,
+    refresh: bool = Query(False, description="Bypass the cache and recompute")
+):
     """
     Get overall system statistics.
     """
+    stats = await _load_system_stats(refresh=refresh)
+    return etag_response(request, stats)
+
+
+@async_ttl_cache(ttl=60)
+async def _load_system_stats(refresh: bool = False) -> SystemStats:
+    """Compute system statistics."""
     try:
-        db = Database.get_db()
-        users_col = db[Collections.USERS]
-        animes_col = db[Collections.ANIMES]
-        ratings_col = db[Collections.RATINGS]
+        cols = get_collections()
+        users_col = cols.users
+        animes_col = cols.animes
+        ratings_col = cols.ratings
         
-        # Count documents
-        total_users = await users_col.count_documents({})
-        total_anime = await animes_col.count_documents({})
-        total_ratings = await ratings_col.count_documents({})
+        # Capture the clock once so both time windows share the same reference
+        now = datetime.utcnow()
+        thirty_days_ago = now - timedelta(days=30)
+        start_of_month = now.replace(day=1, hour=0, minute=0, second=0)
         
         # Calculate average rating
         pipeline = [
             {"$match": {"rating": {"$gt": 0}}},
             {"$group": {"_id": None, "avg": {"$avg": "$rating"}}}
         ]
-        cursor = ratings_col.aggregate(pipeline)
-        result = await cursor.to_list(length=1)
-        avg_rating = result[0]["avg"] if result else 0.0
         
-        # Count active users (logged in within last 30 days)
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        active_users = await users_col.count_documents({"last_login": {"$gte": thirty_days_ago}})
-        
-        # Count new users this month
-        start_of_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0)
-        new_users = await users_col.count_documents({"created_at": {"$gte": start_of_month}})
+        # Run independent queries concurrently
+        (
+            total_users,
+            total_anime,
+            total_ratings,
+            avg_result,
+            active_users,
+            new_users
+        ) = await asyncio.gather(
+            fast_count(users_col),
+            fast_count(animes_col),
+            fast_count(ratings_col),
+            ratings_col.aggregate(pipeline).to_list(length=1),
+            # Active users (logged in within last 30 days)
+            fast_count(users_col, {"last_login": {"$gte": thirty_days_ago}}),
+            # New users this month
+            fast_count(users_col, {"created_at": {"$gte": start_of_month}})
+        )
+        avg_rating = avg_result[0]["avg"] if avg_result else 0.0
         
         return SystemStats(
             total_users=total_users,
@@ -103,38 +136,40 @@ async def get_system_stats():
         )
 
 
+@async_ttl_cache(ttl=60)
+async def _load_models(refresh: bool = False) -> List[ModelResponse]:
+    """Load model metrics, shared by the model list and comparison endpoints."""
+    metrics_col = get_collections().model_metrics
+    
+    cursor = metrics_col.find({}, MODEL_PROJECTION).sort("trained_at", -1).limit(100)
+    return [
+        ModelResponse(
+            model_name=m.get("model_name"),
+            rmse=m.get("rmse", 0),
+            mae=m.get("mae", 0),
+            precision_k=m.get("precision_k", 0),
+            recall_k=m.get("recall_k", 0),
+            f1_k=m.get("f1_k", 0),
+            ndcg_k=m.get("ndcg_k", 0),
+            trained_at=m.get("trained_at"),
+            status="active",
+            description=m.get("description", "")
+        )
+        async for m in cursor
+    ]
+
+
 @router.get("/models", response_model=List[ModelResponse])
-async def get_models():
+async def get_models(
+    request: Request,
+    refresh: bool = Query(False, description="Bypass the cache and recompute")
+):
     """
     Get list of recommendation models with their metrics.
     """
     try:
-        db = Database.get_db()
-        metrics_col = db[Collections.MODEL_METRICS]
-        
-        cursor = metrics_col.find().sort("trained_at", -1)
-        models = await cursor.to_list(length=100)
-        
-        # If no models in DB, return empty list
-        if not models:
-            return []
-        
-        results = []
-        for m in models:
-            results.append(ModelResponse(
-                model_name=m.get("model_name"),
-                rmse=m.get("rmse", 0),
-                mae=m.get("mae", 0),
-                precision_k=m.get("precision_k", 0),
-                recall_k=m.get("recall_k", 0),
-                f1_k=m.get("f1_k", 0),
-                ndcg_k=m.get("ndcg_k", 0),
-                trained_at=m.get("trained_at"),
-                status="active",
-                description=m.get("description", "")
-            ))
-        
-        return results
+        models = await _load_models(refresh=refresh)
+        return etag_response(request, models)
     
     except Exception as e:
         raise HTTPException(
@@ -196,41 +231,74 @@ async def compare_models():
     """
     Compare all models' performance metrics.
     """
-    models = await get_models()
-    return ModelCompareResponse(models=models)
+    try:
+        models = await _load_models()
+        return ModelCompareResponse(models=models)
+    
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get models: {str(e)}"
+        )
 
 
-@router.get("/visualization", response_model=VisualizationData)
-async def get_visualization_data():
-    """
-    Get data for admin dashboard visualizations.
-    """
-    try:
-        db = Database.get_db()
-        animes_col = db[Collections.ANIMES]
-        ratings_col = db[Collections.RATINGS]
-        
-        # Genre distribution
-        genre_pipeline = [
-            {"$unwind": "$genre"},
-            {"$group": {"_id": "$genre", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}},
-            {"$limit": 10}
+# Keys of the materialized dashboard aggregates
+DASHBOARD_KEYS = ["genre_distribution", "type_distribution", "rating_distribution", "top_anime"]
+
+# Seconds between background refreshes of the dashboard aggregates
+DASHBOARD_REFRESH_INTERVAL = 600
+
+
+async def compute_dashboard_data() -> dict:
+    """Run the dashboard aggregation pipelines against the source collections."""
+    cols = get_collections()
+    animes_col = cols.animes
+    ratings_col = cols.ratings
+    
+    async def fetch_anime_distributions():
+        # Genre, type and top-anime aggregates share one pass over the animes collection
+        facet_pipeline = [
+            {"$facet": {
+                "genres": [
+                    # Skip anime without genres before unwinding
+                    {"$match": {"genre": {"$exists": True, "$ne": []}}},
+                    {"$unwind": "$genre"},
+                    {"$group": {"_id": "$genre", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1}},
+                    {"$limit": 10}
+                ],
+                "types": [
+                    {"$group": {"_id": "$type", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1}}
+                ],
+                "top": [
+                    {"$sort": {"rating": -1}},
+                    {"$limit": 5},
+                    {"$project": {"_id": 0, "name": 1, "rating": 1, "members": 1}}
+                ]
+            }}
         ]
-        genre_cursor = animes_col.aggregate(genre_pipeline)
-        genre_dist = [{"name": d["_id"], "value": d["count"]} async for d in genre_cursor]
+        result = await animes_col.aggregate(facet_pipeline).to_list(length=1)
+        facets = result[0] if result else {"genres": [], "types": [], "top": []}
         
-        # Type distribution
-        type_pipeline = [
-            {"$group": {"_id": "$type", "count": {"$sum": 1}}},
-            {"$sort": {"count": -1}}
+        genre_dist = [{"name": d["_id"], "value": d["count"]} for d in facets["genres"]]
+        type_dist = [{"name": d["_id"] or "Unknown", "value": d["count"]} for d in facets["types"]]
+        top_anime = [
+            {
+                "rank": rank,
+                "name": anime.get("name"),
+                "rating": anime.get("rating", 0),
+                "members": anime.get("members", 0)
+            }
+            for rank, anime in enumerate(facets["top"], start=1)
         ]
-        type_cursor = animes_col.aggregate(type_pipeline)
-        type_dist = [{"name": d["_id"] or "Unknown", "value": d["count"]} async for d in type_cursor]
-        
+        return genre_dist, type_dist, top_anime
+    
+    async def fetch_rating_distribution():
         # Rating distribution (histogram)
         rating_pipeline = [
-            {"$match": {"rating": {"$gt": 0}}},
+            # Bounded range so the match is an index range scan on rating
+            {"$match": {"rating": {"$gte": 1, "$lte": 10}}},
             {"$bucket": {
                 "groupBy": "$rating",
                 "boundaries": [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11],
@@ -240,9 +308,79 @@ async def get_visualization_data():
         ]
         try:
             rating_cursor = ratings_col.aggregate(rating_pipeline)
-            rating_dist = [{"rating": d["_id"], "count": d["count"]} async for d in rating_cursor]
+            return [{"rating": d["_id"], "count": d["count"]} async for d in rating_cursor]
         except Exception:
-            rating_dist = []
+            return []
+    
+    # The ratings histogram targets another collection, run both concurrently
+    (genre_dist, type_dist, top_anime), rating_dist = await asyncio.gather(
+        fetch_anime_distributions(),
+        fetch_rating_distribution()
+    )
+    return {
+        "genre_distribution": genre_dist,
+        "type_distribution": type_dist,
+        "rating_distribution": rating_dist,
+        "top_anime": top_anime
+    }
+
+
+async def refresh_dashboard_cache() -> dict:
+    """Recompute the dashboard aggregates and store them in the dashboard cache collection."""
+    data = await compute_dashboard_data()
+    cache_col = get_collections().dashboard_cache
+    now = datetime.utcnow()
+    
+    await asyncio.gather(*[
+        cache_col.replace_one(
+            {"_id": key},
+            {"_id": key, "data": value, "updated_at": now},
+            upsert=True
+        )
+        for key, value in data.items()
+    ])
+    _load_visualization_data.cache_clear()
+    return data
+
+
+async def dashboard_refresh_loop(interval: float = DASHBOARD_REFRESH_INTERVAL) -> None:
+    """Periodically refresh the materialized dashboard aggregates."""
+    while True:
+        try:
+            await refresh_dashboard_cache()
+            logger.info("Refreshed dashboard cache")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to refresh dashboard cache: {e}")
+        await asyncio.sleep(interval)
+
+
+@router.get("/visualization", response_model=VisualizationData)
+async def get_visualization_data(
+    request: Request,
+    refresh: bool = Query(False, description="Bypass the cache and recompute")
+):
+    """
+    Get data for admin dashboard visualizations.
+    Reads the aggregates materialized by refresh_dashboard_cache.
+    """
+    data = await _load_visualization_data(refresh=refresh)
+    return etag_response(request, data)
+
+
+@async_ttl_cache(ttl=60)
+async def _load_visualization_data(refresh: bool = False) -> VisualizationData:
+    """Build visualization data from the dashboard cache collection."""
+    try:
+        cache_col = get_collections().dashboard_cache
+        
+        cursor = cache_col.find({"_id": {"$in": DASHBOARD_KEYS}})
+        data = {d["_id"]: d["data"] async for d in cursor}
+        
+        # Not materialized yet (e.g. first request after startup)
+        if len(data) < len(DASHBOARD_KEYS):
+            data = await compute_dashboard_data()
         
         # Mock activity timeline (in real app, would aggregate from history)
         activity_timeline = [
@@ -254,25 +392,12 @@ async def get_visualization_data():
             {"name": "Jun", "users": 12500, "ratings": 72000},
         ]
         
-        # Top anime
-        top_cursor = animes_col.find().sort("rating", -1).limit(5)
-        top_anime = []
-        rank = 1
-        async for anime in top_cursor:
-            top_anime.append({
-                "rank": rank,
-                "name": anime.get("name"),
-                "rating": anime.get("rating", 0),
-                "members": anime.get("members", 0)
-            })
-            rank += 1
-        
         return VisualizationData(
-            genre_distribution=genre_dist,
-            type_distribution=type_dist,
-            rating_distribution=rating_dist,
+            genre_distribution=data["genre_distribution"],
+            type_distribution=data["type_distribution"],
+            rating_distribution=data["rating_distribution"],
             activity_timeline=activity_timeline,
-            top_anime=top_anime
+            top_anime=data["top_anime"]
         )
     
     except Exception as e:
@@ -282,35 +407,64 @@ async def get_visualization_data():
         )
 
 
-@router.get("/database/status")
-async def get_database_status():
+@router.post("/visualization/refresh")
+async def refresh_visualization_data():
     """
-    Get database health and status information.
+    Recompute the materialized dashboard aggregates on demand.
     """
     try:
-        db = Database.get_db()
-        
-        # Get database stats
-        stats = await db.command("dbStats")
-        
-        # Collection counts
-        animes_count = await db[Collections.ANIMES].count_documents({})
-        ratings_count = await db[Collections.RATINGS].count_documents({})
-        users_count = await db[Collections.USERS].count_documents({})
-        
+        await refresh_dashboard_cache()
         return {
-            "status": "connected",
-            "database": db.name,
-            "collections": {
-                "animes": animes_count,
-                "ratings": ratings_count,
-                "users": users_count
-            },
-            "storage_size": stats.get("storageSize", 0),
-            "data_size": stats.get("dataSize", 0),
-            "index_size": stats.get("indexSize", 0)
+            "success": True,
+            "message": "Visualization data refreshed",
+            "refreshed_at": datetime.utcnow().isoformat()
         }
     
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to refresh visualization data: {str(e)}"
+        )
+
+
+@async_ttl_cache(ttl=60)
+async def _load_database_status(refresh: bool = False) -> Dict[str, Any]:
+    """Fetch database stats and collection counts (errors propagate, so they are never cached)."""
+    db = Database.get_db()
+    cols = get_collections()
+    
+    # Database stats and collection counts, fetched concurrently
+    stats, animes_count, ratings_count, users_count = await asyncio.gather(
+        db.command("dbStats"),
+        fast_count(cols.animes),
+        fast_count(cols.ratings),
+        fast_count(cols.users)
+    )
+    
+    return {
+        "status": "connected",
+        "database": db.name,
+        "collections": {
+            "animes": animes_count,
+            "ratings": ratings_count,
+            "users": users_count
+        },
+        "storage_size": stats.get("storageSize", 0),
+        "data_size": stats.get("dataSize", 0),
+        "index_size": stats.get("indexSize", 0)
+    }
+
+
+@router.get("/database/status")
+async def get_database_status(
+    refresh: bool = Query(False, description="Bypass the cache and recompute")
+):
+    """
+    Get database health and status information.
+    """
+    try:
+        return await _load_database_status(refresh=refresh)
+    
     except Exception as e:
         return {
             "status": "error",
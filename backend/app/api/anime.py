@@ -3,22 +3,81 @@ Anime API endpoints.
 Handles anime listing, search, and details.
 """
 
-from fastapi import APIRouter, HTTPException, Query, status
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request, status
+from typing import List, Literal, Optional
 from pydantic import BaseModel
+from bson import ObjectId
+from enum import Enum
+import asyncio
+import base64
+import json
+import re
 
-from app.database import Database, Collections, AnimeResponse, AnimeDetail
+from app.database import get_collections, fast_count, AnimeResponse, AnimeDetail, to_anime_response
+from app.utils import async_ttl_cache, etag_response
 
 router = APIRouter()
 
+# Queries shorter than this are matched as a name prefix instead of text search
+MIN_TEXT_SEARCH_LENGTH = 3
+
+# Word tokens of a name, for checking whether a query word matched whole
+WORD_PATTERN = re.compile(r"\w+")
+
+# Fields needed to build an AnimeResponse
+LIST_PROJECTION = {
+    "anime_id": 1, "name": 1, "genre": 1, "type": 1,
+    "episodes": 1, "rating": 1, "members": 1
+}
+
+
+class SortField(str, Enum):
+    """Sort fields for the anime list."""
+    rating = "rating"
+    name = "name"
+    members = "members"
+
+
+class TopSortField(str, Enum):
+    """Sort fields for top anime."""
+    rating = "rating"
+    members = "members"
+
 
 class AnimePaginatedResponse(BaseModel):
     """Paginated anime list response."""
     items: List[AnimeResponse]
-    total: int
+    total: Optional[int] = None
     page: int
     page_size: int
-    total_pages: int
+    total_pages: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+
+def encode_cursor(sort_value, doc_id: str) -> str:
+    """Encode the last-seen (sort value, _id) pair as an opaque cursor."""
+    payload = json.dumps([sort_value, doc_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def decode_cursor(cursor: str):
+    """Decode a cursor produced by encode_cursor into (sort value, _id)."""
+    try:
+        sort_value, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return sort_value, ObjectId(doc_id)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+@async_ttl_cache(ttl=300, maxsize=256)
+async def count_anime(type: Optional[str] = None) -> int:
+    """Count anime matching the listing filter."""
+    collection = get_collections().animes
+    query = {"type": type} if type else {}
+    return await fast_count(collection, query)
 
 
 @router.get("", response_model=AnimePaginatedResponse)
@@ -26,15 +85,18 @@ async def get_anime_list(
     page: int = Query(1, ge=1, description="Page number"),
     page_size: int = Query(20, ge=1, le=100, description="Items per page"),
     type: Optional[str] = Query(None, description="Filter by type (TV, Movie, OVA, etc.)"),
-    sort: str = Query("rating", description="Sort by: rating, name, members"),
-    order: str = Query("desc", description="Sort order: asc, desc")
+    sort: SortField = Query(SortField.rating, description="Sort by: rating, name, members"),
+    order: Literal["asc", "desc"] = Query("desc", description="Sort order: asc, desc"),
+    cursor: Optional[str] = Query(None, description="Cursor from a previous page's next_cursor"),
+    with_total: bool = Query(True, description="Include total and total_pages")
 ):
     """
     Get paginated list of anime with optional filters.
+    Pass next_cursor back as cursor to fetch the following page without skipping.
     """
     try:
-        db = Database.get_db()
-        collection = db[Collections.ANIMES]
+        cols = get_collections()
+        collection = cols.animes
         
         # Build query filter
         query = {}
@@ -42,42 +104,55 @@ async def get_anime_list(
             query["type"] = type
         
         # Build sort
-        sort_field = sort if sort in ["rating", "name", "members"] else "rating"
+        sort_field = sort.value
         sort_order = -1 if order == "desc" else 1
         
-        # Get total count
-        total = await collection.count_documents(query)
-        
-        # Calculate pagination
-        skip = (page - 1) * page_size
-        total_pages = (total + page_size - 1) // page_size
-        
-        # Get anime list
-        cursor = collection.find(query).sort(sort_field, sort_order).skip(skip).limit(page_size)
-        anime_list = await cursor.to_list(length=page_size)
-        
-        # Convert to response model
-        items = []
-        for anime in anime_list:
-            items.append(AnimeResponse(
-                id=str(anime.get("_id")),
-                anime_id=anime.get("anime_id"),
-                name=anime.get("name", ""),
-                genre=anime.get("genre", []),
-                type=anime.get("type", ""),
-                episodes=anime.get("episodes", 0),
-                rating=anime.get("rating", 0.0),
-                members=anime.get("members", 0)
-            ))
+        if cursor:
+            # Keyset pagination: continue after the last-seen (sort value, _id)
+            after_value, after_id = decode_cursor(cursor)
+            op = "$lt" if sort_order == -1 else "$gt"
+            query = {
+                **query,
+                "$or": [
+                    {sort_field: {op: after_value}},
+                    {sort_field: after_value, "_id": {op: after_id}}
+                ]
+            }
+            skip = 0
+        else:
+            skip = (page - 1) * page_size
+        
+        # Get anime list (_id breaks ties so the order is stable across pages)
+        anime_cursor = collection.find(query, LIST_PROJECTION).sort(
+            [(sort_field, sort_order), ("_id", sort_order)]
+        ).skip(skip).limit(page_size)
+        async def fetch_items():
+            return [to_anime_response(anime) async for anime in anime_cursor]
+        
+        if with_total:
+            # Count concurrently with the page fetch
+            items, total = await asyncio.gather(fetch_items(), count_anime(type))
+            total_pages = (total + page_size - 1) // page_size
+        else:
+            items = await fetch_items()
+            total = total_pages = None
+        
+        next_cursor = None
+        if len(items) == page_size:
+            last = items[-1]
+            next_cursor = encode_cursor(getattr(last, sort_field), last.id)
         
         return AnimePaginatedResponse(
             items=items,
             total=total,
             page=page,
             page_size=page_size,
-            total_pages=total_pages
+            total_pages=total_pages,
+            next_cursor=next_cursor
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -93,30 +168,43 @@ async def search_anime(
 ):
     """
     Search anime by name.
-    Uses regex for partial matching.
+    Uses the text index, adding name-prefix matches for short queries and
+    for queries whose last word is still being typed.
     """
     try:
-        db = Database.get_db()
-        collection = db[Collections.ANIMES]
+        cols = get_collections()
+        collection = cols.animes
         
-        # Search by name (case-insensitive)
-        query = {"name": {"$regex": q, "$options": "i"}}
+        results = []
+        q = q.strip()
+        q_lower = q.lower()
         
-        cursor = collection.find(query).sort("rating", -1).limit(limit)
-        anime_list = await cursor.to_list(length=limit)
+        if len(q) >= MIN_TEXT_SEARCH_LENGTH:
+            # Full-text search ranked by relevance
+            projection = {**LIST_PROJECTION, "score": {"$meta": "textScore"}}
+            cursor = collection.find({"$text": {"$search": q}}, projection).sort(
+                [("score", {"$meta": "textScore"}), ("rating", -1)]
+            ).limit(limit)
+            results = [to_anime_response(anime) async for anime in cursor]
         
-        results = []
-        for anime in anime_list:
-            results.append(AnimeResponse(
-                id=str(anime.get("_id")),
-                anime_id=anime.get("anime_id"),
-                name=anime.get("name", ""),
-                genre=anime.get("genre", []),
-                type=anime.get("type", ""),
-                episodes=anime.get("episodes", 0),
-                rating=anime.get("rating", 0.0),
-                members=anime.get("members", 0)
-            ))
+        # $text only matches whole words, so a partial last word ("naru",
+        # "one p") needs the prefix match as well
+        words = WORD_PATTERN.findall(q_lower)
+        last_word = words[-1] if words else ""
+        partial = not any(
+            last_word in WORD_PATTERN.findall(anime.name.lower()) for anime in results
+        )
+        
+        if partial:
+            # Anchored prefix on the lowercased name (bounded scan on its index)
+            query = {"name_lower": {"$regex": f"^{re.escape(q_lower)}"}}
+            cursor = collection.find(query, LIST_PROJECTION).sort("rating", -1).limit(limit)
+            prefix_results = [to_anime_response(anime) async for anime in cursor]
+            
+            # Prefix matches first, then the remaining text matches
+            seen = {anime.anime_id for anime in prefix_results}
+            results = prefix_results + [a for a in results if a.anime_id not in seen]
+            results = results[:limit]
         
         return results
     
@@ -129,35 +217,20 @@ async def search_anime(
 
 @router.get("/top", response_model=List[AnimeResponse])
 async def get_top_anime(
+    request: Request,
     n: int = Query(10, ge=1, le=100, description="Number of top anime to return"),
-    by: str = Query("rating", description="Sort by: rating or members")
+    by: TopSortField = Query(TopSortField.rating, description="Sort by: rating or members")
 ):
     """
     Get top anime sorted by rating or members.
     """
     try:
-        db = Database.get_db()
-        collection = db[Collections.ANIMES]
-        
-        sort_field = "rating" if by == "rating" else "members"
-        
-        cursor = collection.find().sort(sort_field, -1).limit(n)
-        anime_list = await cursor.to_list(length=n)
+        cols = get_collections()
+        collection = cols.animes
         
-        results = []
-        for anime in anime_list:
-            results.append(AnimeResponse(
-                id=str(anime.get("_id")),
-                anime_id=anime.get("anime_id"),
-                name=anime.get("name", ""),
-                genre=anime.get("genre", []),
-                type=anime.get("type", ""),
-                episodes=anime.get("episodes", 0),
-                rating=anime.get("rating", 0.0),
-                members=anime.get("members", 0)
-            ))
-        
-        return results
+        cursor = collection.find({}, LIST_PROJECTION).sort(by.value, -1).limit(n)
+        results = [to_anime_response(anime) async for anime in cursor]
+        return etag_response(request, results)
     
     except Exception as e:
         raise HTTPException(
@@ -172,9 +245,9 @@ async def get_anime_detail(anime_id: int):
     Get detailed information about a specific anime.
     """
     try:
-        db = Database.get_db()
-        collection = db[Collections.ANIMES]
-        ratings_collection = db[Collections.RATINGS]
+        cols = get_collections()
+        collection = cols.animes
+        ratings_collection = cols.ratings
         
         # Find anime
         anime = await collection.find_one({"anime_id": anime_id})
@@ -185,8 +258,11 @@ async def get_anime_detail(anime_id: int):
                 detail=f"Anime with id {anime_id} not found"
             )
         
-        # Count ratings for this anime
-        rating_count = await ratings_collection.count_documents({"anime_id": anime_id})
+        # Rating count is denormalized onto the anime document
+        rating_count = anime.get("rating_count")
+        if rating_count is None:
+            # Not backfilled yet
+            rating_count = await ratings_collection.count_documents({"anime_id": anime_id})
         
         return AnimeDetail(
             id=str(anime.get("_id")),
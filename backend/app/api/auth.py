@@ -5,10 +5,11 @@ Simple user authentication by user_id (no password required).
 
 from fastapi import APIRouter, HTTPException, status
 from pydantic import BaseModel
+from pymongo import ReturnDocument
 from datetime import datetime
 from typing import Optional
 
-from app.database import Database, Collections, UserInDB
+from app.database import get_collections, UserInDB
 
 router = APIRouter()
 
@@ -39,27 +40,24 @@ async def login(request: LoginRequest):
     No password required as per requirements.
     """
     try:
-        db = Database.get_db()
-        users_collection = db[Collections.USERS]
+        cols = get_collections()
+        users_collection = cols.users
         
-        # Check if user exists
-        existing_user = await users_collection.find_one({"user_id": request.user_id})
+        now = datetime.utcnow()
         
-        if existing_user:
-            # Update last login
-            await users_collection.update_one(
-                {"user_id": request.user_id},
-                {"$set": {"last_login": datetime.utcnow()}}
-            )
+        # Update last login, creating the user if it does not exist (single atomic round-trip)
+        new_user = UserInDB(user_id=request.user_id, created_at=now, last_login=now)
+        on_insert = new_user.model_dump(by_alias=True, exclude={"id", "last_login"})
+        previous = await users_collection.find_one_and_update(
+            {"user_id": request.user_id},
+            {"$set": {"last_login": now}, "$setOnInsert": on_insert},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        
+        if previous:
             message = "Login successful"
         else:
-            # Create new user
-            new_user = UserInDB(
-                user_id=request.user_id,
-                created_at=datetime.utcnow(),
-                last_login=datetime.utcnow()
-            )
-            await users_collection.insert_one(new_user.model_dump(by_alias=True, exclude={"id"}))
             message = "New user created and logged in"
         
         return LoginResponse(
@@ -94,12 +92,14 @@ async def verify_user(user_id: int):
     Verify if a user exists in the database.
     """
     try:
-        db = Database.get_db()
-        users_collection = db[Collections.USERS]
+        cols = get_collections()
+        users_collection = cols.users
         
-        user = await users_collection.find_one({"user_id": user_id})
+        user = await users_collection.find_one(
+            {"user_id": user_id}, {"_id": 0, "created_at": 1, "last_login": 1}
+        )
         
-        if user:
+        if user is not None:
             return {
                 "exists": True,
                 "user_id": user_id,
@@ -3,12 +3,12 @@ Recommendation API endpoints.
 Handles personalized recommendations and similar anime.
 """
 
-from fastapi import APIRouter, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from typing import List, Optional
 from pydantic import BaseModel
 
 from app.database import Database, Collections, AnimeResponse
-from app.services.recommendation_service import RecommendationService
+from app.services.recommendation_service import RecommendationService, get_service
 
 router = APIRouter()
 
@@ -24,14 +24,14 @@ class RecommendationResponse(BaseModel):
 async def get_recommendations(
     user_id: int = Query(..., description="User ID for personalized recommendations"),
     n: int = Query(20, ge=1, le=50, description="Number of recommendations"),
-    model: str = Query("hybrid", description="Model to use: content_based, item_based, user_based, hybrid")
+    model: str = Query("hybrid", description="Model to use: content_based, item_based, user_based, hybrid"),
+    service: RecommendationService = Depends(get_service)
 ):
     """
     Get personalized anime recommendations for a user.
     Uses the specified recommendation model.
     """
     try:
-        service = RecommendationService()
         recommendations = await service.get_recommendations(
             user_id=user_id,
             n=n,
@@ -59,14 +59,14 @@ async def get_recommendations(
 @router.get("/similar/{anime_id}", response_model=RecommendationResponse)
 async def get_similar_anime(
     anime_id: int,
-    n: int = Query(20, ge=1, le=50, description="Number of similar anime")
+    n: int = Query(20, ge=1, le=50, description="Number of similar anime"),
+    service: RecommendationService = Depends(get_service)
 ):
     """
     Get anime similar to a specific anime.
     Uses content-based filtering.
     """
     try:
-        service = RecommendationService()
         similar = await service.get_similar_anime(
             anime_id=anime_id,
             n=n
@@ -91,14 +91,14 @@ async def get_similar_anime(
 
 @router.get("/popular", response_model=RecommendationResponse)
 async def get_popular_recommendations(
-    n: int = Query(20, ge=1, le=50, description="Number of recommendations")
+    n: int = Query(20, ge=1, le=50, description="Number of recommendations"),
+    service: RecommendationService = Depends(get_service)
 ):
     """
     Get popular anime recommendations (fallback for new users).
     Uses overall popularity metrics.
     """
     try:
-        service = RecommendationService()
         popular = await service.get_popular_anime(n=n)
         
         return RecommendationResponse(
@@ -117,14 +117,14 @@ async def get_popular_recommendations(
 async def get_realtime_recommendations(
     user_id: int = Query(..., description="User ID"),
     context_anime_id: Optional[int] = Query(None, description="Current anime being viewed"),
-    n: int = Query(20, ge=1, le=20, description="Number of recommendations")
+    n: int = Query(20, ge=1, le=20, description="Number of recommendations"),
+    service: RecommendationService = Depends(get_service)
 ):
     """
     Get real-time recommendations based on current user context.
     Takes into account the anime currently being viewed.
     """
     try:
-        service = RecommendationService()
         
         if context_anime_id:
             # Get similar to current anime
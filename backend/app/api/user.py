@@ -3,19 +3,43 @@ User API endpoints.
 Handles user profile, ratings, and history.
 """
 
-from fastapi import APIRouter, HTTPException, Query, status
+from fastapi import APIRouter, HTTPException, Query, Response, status
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
+import asyncio
 
 from app.database import (
-    Database, Collections, 
+    Collections, get_collections, Cache, redis_cache,
     UserProfile, RatingCreate, RatingResponse, RatingInDB,
     UserHistoryInDB
 )
 
 router = APIRouter()
 
+# Seconds a cached user profile stays valid (invalidated on rating)
+PROFILE_CACHE_TTL = 300
+
+# Seconds a cached rating history page stays valid
+RATINGS_CACHE_TTL = 60
+
+# Filter shapes shared by every request
+RATED = {"$gt": 0}
+HISTORY_PROJECTION = {"_id": 0, "anime_id": 1, "action": 1, "timestamp": 1, "details": 1}
+
+MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
+               "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def profile_cache_key(user_id: int, **_) -> str:
+    """Redis key of a cached user profile."""
+    return f"user:{user_id}:profile"
+
+
+def ratings_version_key(user_id: int) -> str:
+    """Redis key of the version stamp shared by a user's cached rating pages."""
+    return f"user:{user_id}:ratings:ver"
+
 
 class RatingHistoryItem(BaseModel):
     """Rating history item with anime info."""
@@ -44,57 +68,88 @@ class RatingHistoryResponse(BaseModel):
 
 
 @router.get("/{user_id}/profile", response_model=UserProfileResponse)
+@redis_cache(key_fn=profile_cache_key, ttl=PROFILE_CACHE_TTL)
 async def get_user_profile(user_id: int):
     """
     Get user profile with statistics.
     """
     try:
-        db = Database.get_db()
-        users_col = db[Collections.USERS]
-        ratings_col = db[Collections.RATINGS]
-        animes_col = db[Collections.ANIMES]
+        cols = get_collections()
+        users_col = cols.users
+        ratings_col = cols.ratings
+        
+        rated_match = {"$match": {"user_id": user_id, "rating": RATED}}
         
-        # Get user
-        user = await users_col.find_one({"user_id": user_id})
-        if not user:
+        # Rating totals and activity for the last 12 months with ratings
+        activity_pipeline = [
+            rated_match,
+            {"$facet": {
+                "totals": [
+                    {"$group": {"_id": None, "total": {"$sum": 1}, "avg": {"$avg": "$rating"}}}
+                ],
+                "monthly": [
+                    {"$match": {"timestamp": {"$type": "date"}}},
+                    {"$group": {
+                        "_id": {"$dateToString": {"format": "%Y-%m", "date": "$timestamp"}},
+                        "count": {"$sum": 1}
+                    }},
+                    {"$sort": {"_id": -1}},
+                    {"$limit": 12}
+                ]
+            }}
+        ]
+        
+        # Genre preferences, joined server-side
+        genres_pipeline = [
+            rated_match,
+            {"$lookup": {
+                "from": Collections.ANIMES,
+                "localField": "anime_id",
+                "foreignField": "anime_id",
+                "as": "anime"
+            }},
+            {"$unwind": "$anime"},
+            {"$unwind": "$anime.genre"},
+            {"$group": {"_id": "$anime.genre", "count": {"$sum": 1}}},
+            {"$facet": {
+                "top": [{"$sort": {"count": -1}}, {"$limit": 5}],
+                "total": [{"$group": {"_id": None, "count": {"$sum": "$count"}}}]
+            }}
+        ]
+        
+        # User lookup and statistics are independent, run them concurrently
+        user, activity, genre_facets = await asyncio.gather(
+            users_col.find_one({"user_id": user_id}, {"_id": 0, "created_at": 1}),
+            ratings_col.aggregate(activity_pipeline).to_list(length=1),
+            ratings_col.aggregate(genres_pipeline).to_list(length=1)
+        )
+        if user is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"User {user_id} not found"
             )
         
-        # Get user ratings
-        ratings_cursor = ratings_col.find({"user_id": user_id, "rating": {"$gt": 0}})
-        ratings = await ratings_cursor.to_list(length=10000)
-        
-        total_ratings = len(ratings)
-        avg_rating = sum(r["rating"] for r in ratings) / total_ratings if total_ratings > 0 else 0
+        totals = activity[0]["totals"] if activity else []
+        total_ratings = totals[0]["total"] if totals else 0
+        avg_rating = totals[0]["avg"] if totals else 0
         
-        # Calculate genre preferences
-        genre_counts = {}
-        for rating in ratings:
-            anime = await animes_col.find_one({"anime_id": rating["anime_id"]})
-            if anime:
-                for genre in anime.get("genre", []):
-                    genre_counts[genre] = genre_counts.get(genre, 0) + 1
-        
-        total_genre_count = sum(genre_counts.values())
+        top_genres = genre_facets[0]["top"] if genre_facets else []
+        genre_total = genre_facets[0]["total"] if genre_facets else []
+        total_genre_count = genre_total[0]["count"] if genre_total else 0
         favorite_genres = [
             {
-                "genre": genre,
-                "count": count,
-                "percentage": round(count / total_genre_count * 100, 1) if total_genre_count > 0 else 0
+                "genre": g["_id"],
+                "count": g["count"],
+                "percentage": round(g["count"] / total_genre_count * 100, 1) if total_genre_count > 0 else 0
             }
-            for genre, count in sorted(genre_counts.items(), key=lambda x: x[1], reverse=True)[:5]
+            for g in top_genres
         ]
         
-        # Calculate monthly activity (mock for now)
+        # Monthly activity, oldest first ("2024-03" -> "Mar")
+        months = activity[0]["monthly"] if activity else []
         monthly_activity = [
-            {"month": "Jan", "count": 10},
-            {"month": "Feb", "count": 12},
-            {"month": "Mar", "count": 15},
-            {"month": "Apr", "count": 8},
-            {"month": "May", "count": 20},
-            {"month": "Jun", "count": 14},
+            {"month": MONTH_NAMES[int(m["_id"][5:7]) - 1], "count": m["count"]}
+            for m in reversed(months)
         ]
         
         # Format join date
@@ -134,48 +189,79 @@ async def get_user_ratings(
     Get user's rating history.
     """
     try:
-        db = Database.get_db()
-        ratings_col = db[Collections.RATINGS]
-        animes_col = db[Collections.ANIMES]
+        # Pages are keyed by version so a rating invalidates all of them at once
+        version = await Cache.get_version(ratings_version_key(user_id))
+        cache_key = f"user:{user_id}:ratings:v{version}:{sort}:{page}:{page_size}"
+        cached = await Cache.get_bytes(cache_key)
+        if cached is not None:
+            return Response(content=cached, media_type="application/json")
+        
+        cols = get_collections()
+        ratings_col = cols.ratings
         
         # Build query
-        query = {"user_id": user_id, "rating": {"$gt": 0}}
+        query = {"user_id": user_id, "rating": RATED}
         
         # Sort
         sort_field = "timestamp" if sort == "recent" else "rating"
         sort_order = -1
         
-        # Get total count
-        total = await ratings_col.count_documents(query)
-        
-        # Get ratings
+        # Page rows joined with anime info, plus the total count, in one round-trip
         skip = (page - 1) * page_size
-        cursor = ratings_col.find(query).sort(sort_field, sort_order).skip(skip).limit(page_size)
-        ratings = await cursor.to_list(length=page_size)
+        pipeline = [
+            {"$match": query},
+            {"$facet": {
+                "items": [
+                    {"$sort": {sort_field: sort_order}},
+                    {"$skip": skip},
+                    {"$limit": page_size},
+                    {"$lookup": {
+                        "from": Collections.ANIMES,
+                        "localField": "anime_id",
+                        "foreignField": "anime_id",
+                        "as": "anime"
+                    }},
+                    {"$unwind": {"path": "$anime", "preserveNullAndEmptyArrays": True}},
+                    {"$project": {
+                        "_id": 0,
+                        "anime_id": 1,
+                        "rating": 1,
+                        "timestamp": 1,
+                        "anime_name": "$anime.name",
+                        "genres": "$anime.genre"
+                    }}
+                ],
+                "total": [{"$count": "n"}]
+            }}
+        ]
+        result = await ratings_col.aggregate(pipeline).to_list(length=1)
+        facets = result[0] if result else {"items": [], "total": []}
+        total = facets["total"][0]["n"] if facets["total"] else 0
         
         # Build response with anime info
         items = []
-        for rating in ratings:
-            anime = await animes_col.find_one({"anime_id": rating["anime_id"]})
-            
+        for rating in facets["items"]:
             timestamp = rating.get("timestamp", datetime.utcnow())
             if isinstance(timestamp, datetime):
                 date_str = timestamp.strftime("%Y-%m-%d")
             else:
                 date_str = "Unknown"
             
-            items.append(RatingHistoryItem(
+            # Trusted server data, skip validation
+            items.append(RatingHistoryItem.model_construct(
                 anime_id=rating["anime_id"],
-                anime_name=anime.get("name", "Unknown") if anime else "Unknown",
+                anime_name=rating.get("anime_name", "Unknown"),
                 rating=rating["rating"],
-                genres=anime.get("genre", []) if anime else [],
+                genres=rating.get("genres", []),
                 date=date_str
             ))
         
-        return RatingHistoryResponse(
+        response = RatingHistoryResponse.model_construct(
             items=items,
             total=total
         )
+        await Cache.set_json(cache_key, response, RATINGS_CACHE_TTL)
+        return response
     
     except Exception as e:
         raise HTTPException(
@@ -191,46 +277,58 @@ async def rate_anime(user_id: int, rating_data: RatingCreate):
     Creates or updates rating for the user-anime pair.
     """
     try:
-        db = Database.get_db()
-        ratings_col = db[Collections.RATINGS]
-        animes_col = db[Collections.ANIMES]
-        history_col = db[Collections.USER_HISTORY]
+        cols = get_collections()
+        ratings_col = cols.ratings
+        animes_col = cols.animes
+        history_col = cols.user_history
         
-        # Verify anime exists
-        anime = await animes_col.find_one({"anime_id": rating_data.anime_id})
+        # Verify anime exists and check for an existing rating concurrently
+        anime, existing = await asyncio.gather(
+            animes_col.find_one({"anime_id": rating_data.anime_id}, {"_id": 1}),
+            ratings_col.find_one(
+                {"user_id": user_id, "anime_id": rating_data.anime_id},
+                {"_id": 0, "rating": 1}
+            )
+        )
         if not anime:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Anime {rating_data.anime_id} not found"
             )
         
-        # Check if rating already exists
-        existing = await ratings_col.find_one({
-            "user_id": user_id,
-            "anime_id": rating_data.anime_id
-        })
-        
         now = datetime.utcnow()
         
-        if existing:
-            # Update existing rating
-            old_rating = existing.get("rating", 0)
-            await ratings_col.update_one(
-                {"_id": existing["_id"]},
-                {"$set": {"rating": rating_data.rating, "timestamp": now}}
-            )
-            action = "updated"
-        else:
-            # Create new rating
-            new_rating = RatingInDB(
-                user_id=user_id,
-                anime_id=rating_data.anime_id,
-                rating=rating_data.rating,
-                timestamp=now
-            )
-            await ratings_col.insert_one(new_rating.model_dump(by_alias=True, exclude={"id"}))
+        # Create or update the rating in a single upsert
+        new_rating = RatingInDB(
+            user_id=user_id,
+            anime_id=rating_data.anime_id,
+            rating=rating_data.rating,
+            timestamp=now
+        )
+        result = await ratings_col.update_one(
+            {"user_id": user_id, "anime_id": rating_data.anime_id},
+            {
+                "$set": {"rating": rating_data.rating, "timestamp": now},
+                "$setOnInsert": new_rating.model_dump(
+                    by_alias=True, exclude={"id", "rating", "timestamp"}
+                )
+            },
+            upsert=True
+        )
+        
+        # The upsert result, not the earlier read, decides whether the rating is new,
+        # so concurrent first ratings or a failed write never double-count rating_count
+        writes = []
+        if result.upserted_id is not None:
+            writes.append(animes_col.update_one(
+                {"anime_id": rating_data.anime_id},
+                {"$inc": {"rating_count": 1}}
+            ))
             action = "created"
             old_rating = None
+        else:
+            action = "updated"
+            old_rating = existing.get("rating", 0) if existing is not None else None
         
         # Log to history
         history_entry = UserHistoryInDB(
@@ -240,7 +338,16 @@ async def rate_anime(user_id: int, rating_data: RatingCreate):
             timestamp=now,
             details={"rating": rating_data.rating, "previous": old_rating}
         )
-        await history_col.insert_one(history_entry.model_dump(by_alias=True, exclude={"id"}))
+        writes.append(history_col.insert_one(history_entry.model_dump(by_alias=True, exclude={"id"})))
+        
+        # Remaining writes are independent of each other
+        await asyncio.gather(*writes)
+        
+        # Profile statistics changed
+        await asyncio.gather(
+            Cache.delete(profile_cache_key(user_id)),
+            Cache.bump_version(ratings_version_key(user_id))
+        )
         
         return {
             "success": True,
@@ -265,13 +372,13 @@ async def get_user_anime_rating(user_id: int, anime_id: int):
     Get user's rating for a specific anime.
     """
     try:
-        db = Database.get_db()
-        ratings_col = db[Collections.RATINGS]
+        cols = get_collections()
+        ratings_col = cols.ratings
         
-        rating = await ratings_col.find_one({
-            "user_id": user_id,
-            "anime_id": anime_id
-        })
+        rating = await ratings_col.find_one(
+            {"user_id": user_id, "anime_id": anime_id},
+            {"_id": 0, "rating": 1, "timestamp": 1}
+        )
         
         if rating:
             return {
@@ -302,24 +409,25 @@ async def get_user_history(
     Get user's activity history.
     """
     try:
-        db = Database.get_db()
-        history_col = db[Collections.USER_HISTORY]
+        cols = get_collections()
+        history_col = cols.user_history
         
         query = {"user_id": user_id}
         if action:
             query["action"] = action
         
-        cursor = history_col.find(query).sort("timestamp", -1).limit(limit)
+        cursor = history_col.find(query, HISTORY_PROJECTION).sort("timestamp", -1).limit(limit)
         history = await cursor.to_list(length=limit)
         
-        items = []
-        for h in history:
-            items.append({
+        items = [
+            {
                 "anime_id": h["anime_id"],
                 "action": h["action"],
                 "timestamp": h.get("timestamp"),
                 "details": h.get("details", {})
-            })
+            }
+            for h in history
+        ]
         
         return {"items": items, "total": len(items)}
     
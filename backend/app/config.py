@@ -7,6 +7,7 @@ from pydantic_settings import BaseSettings
 from pydantic import Field
 from functools import lru_cache
 from pathlib import Path
+from typing import Optional
 
 
 class Settings(BaseSettings):
@@ -15,6 +16,13 @@ class Settings(BaseSettings):
     # MongoDB
     mongodb_url: str = Field(default="mongodb://localhost:27017")
     mongodb_database: str = Field(default="anime_recommendation_db")
+    mongo_max_pool: int = Field(default=50)
+    mongo_min_pool: int = Field(default=5)
+    mongo_idle_ms: int = Field(default=60000)
+    mongo_compressors: str = Field(default="zstd,snappy")  # unavailable ones are skipped
+    
+    # Redis (optional, response caching is disabled when unset)
+    redis_url: Optional[str] = Field(default=None)
     
     # Server
     host: str = Field(default="0.0.0.0")
@@ -29,6 +37,10 @@ class Settings(BaseSettings):
     data_processed_path: str = Field(default="./data/processed")
     models_path: str = Field(default="./trained_models")
     
+    # Bulk loading (documents per insert_many, concurrent insert_many calls)
+    load_batch_size: int = Field(default=500)
+    load_concurrency: int = Field(default=64)
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
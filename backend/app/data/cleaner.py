@@ -5,12 +5,40 @@ Handles data preprocessing and cleaning.
 
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
 from pathlib import Path
 from typing import Tuple, Optional
 import logging
 
+try:
+    import polars as pl
+except ImportError:
+    pl = None  # Optional, falls back to pandas groupby
+
 logger = logging.getLogger(__name__)
 
+# Column types for the multithreaded Arrow CSV reader
+ANIME_COLUMN_TYPES = {
+    "anime_id": pa.int32(),
+    "name": pa.string(),
+    "genre": pa.string(),
+    "type": pa.string(),
+    "episodes": pa.string(),  # contains "Unknown"
+    "rating": pa.float64(),
+    "members": pa.int32()
+}
+
+RATING_COLUMN_TYPES = {
+    "user_id": pa.int32(),
+    "anime_id": pa.int32(),
+    "rating": pa.int8()
+}
+
+# Bytes per streamed batch when sampling rating.csv (~100k rows)
+RATING_BLOCK_SIZE = 1_500_000
+
 
 class DataCleaner:
     """Handles data cleaning and preprocessing."""
@@ -31,20 +59,29 @@ class DataCleaner:
         logger.info(f"Loading anime data from {csv_path}")
         
         # Load data
-        df = pd.read_csv(csv_path)
+        df = pa_csv.read_csv(
+            csv_path,
+            convert_options=pa_csv.ConvertOptions(
+                column_types=ANIME_COLUMN_TYPES,
+                strings_can_be_null=True  # empty cells -> null, so fillna defaults apply
+            )
+        ).to_pandas()
         logger.info(f"Loaded {len(df)} anime records")
         
         # Handle missing values
         df['name'] = df['name'].fillna('Unknown')
         df['genre'] = df['genre'].fillna('')
-        df['type'] = df['type'].fillna('Unknown')
+        df['type'] = df['type'].fillna('Unknown').astype('category')
         df['episodes'] = df['episodes'].replace('Unknown', np.nan)
-        df['episodes'] = pd.to_numeric(df['episodes'], errors='coerce').fillna(0).astype(int)
+        df['episodes'] = pd.to_numeric(df['episodes'], errors='coerce').fillna(0).astype(np.int32)
         df['rating'] = pd.to_numeric(df['rating'], errors='coerce').fillna(0.0)
-        df['members'] = pd.to_numeric(df['members'], errors='coerce').fillna(0).astype(int)
+        df['members'] = pd.to_numeric(df['members'], errors='coerce').fillna(0).astype(np.int32)
         
-        # Convert genre to list
-        df['genre'] = df['genre'].apply(lambda x: [g.strip() for g in x.split(',')] if x else [])
+        # Convert genre to list (vectorized split, empty genre -> [])
+        genres = df['genre'].str.strip().str.split(r'\s*,\s*', regex=True)
+        empty = df['genre'].str.strip().eq('')
+        genres[empty] = pd.Series([[] for _ in range(empty.sum())], index=genres.index[empty])
+        df['genre'] = genres
         
         # Remove duplicates
         df = df.drop_duplicates(subset=['anime_id'])
@@ -73,28 +110,21 @@ class DataCleaner:
         logger.info(f"Loading rating data from {csv_path}")
         
         # Load data (may be very large)
+        convert_options = pa_csv.ConvertOptions(column_types=RATING_COLUMN_TYPES)
         if sample_size:
-            # Read in chunks and sample
-            chunks = pd.read_csv(csv_path, chunksize=100000)
-            sampled_chunks = []
-            for chunk in chunks:
-                sampled = chunk.sample(min(len(chunk), sample_size // 100))
-                sampled_chunks.append(sampled)
-                if sum(len(c) for c in sampled_chunks) >= sample_size:
-                    break
-            df = pd.concat(sampled_chunks, ignore_index=True)[:sample_size]
+            df = self._reservoir_sample_ratings(csv_path, sample_size, convert_options)
         else:
-            df = pd.read_csv(csv_path)
+            df = pa_csv.read_csv(csv_path, convert_options=convert_options).to_pandas()
         
         logger.info(f"Loaded {len(df)} rating records")
         
         # Handle missing values
         df = df.dropna(subset=['user_id', 'anime_id'])
         
-        # Convert to proper types
-        df['user_id'] = df['user_id'].astype(int)
-        df['anime_id'] = df['anime_id'].astype(int)
-        df['rating'] = pd.to_numeric(df['rating'], errors='coerce').fillna(-1).astype(int)
+        # Restore narrow types (columns holding nulls come back as float)
+        df['user_id'] = df['user_id'].astype(np.int32)
+        df['anime_id'] = df['anime_id'].astype(np.int32)
+        df['rating'] = df['rating'].fillna(-1).astype(np.int8)
         
         # Handle rating = -1 (watched but not rated)
         # Keep these as they're useful for collaborative filtering
@@ -109,6 +139,73 @@ class DataCleaner:
         
         return df
     
+    def _reservoir_sample_ratings(
+        self,
+        csv_path: str,
+        sample_size: int,
+        convert_options: pa_csv.ConvertOptions
+    ) -> pd.DataFrame:
+        """
+        Draw a uniform random sample of ratings in one streaming pass.
+        
+        Uses reservoir sampling (Algorithm R) over Arrow record batches,
+        so memory stays bounded by sample_size regardless of file size.
+        
+        Args:
+            csv_path: Path to rating.csv
+            sample_size: Number of ratings to keep
+            convert_options: Arrow CSV conversion options
+        
+        Returns:
+            DataFrame with at most sample_size ratings
+        """
+        reader = pa_csv.open_csv(
+            csv_path,
+            read_options=pa_csv.ReadOptions(block_size=RATING_BLOCK_SIZE),
+            convert_options=convert_options
+        )
+        rng = np.random.default_rng()
+        
+        user_ids = np.empty(sample_size, dtype=np.int32)
+        anime_ids = np.empty(sample_size, dtype=np.int32)
+        ratings = np.empty(sample_size, dtype=np.int8)
+        seen = 0
+        
+        for batch in reader:
+            # Rows without ids are dropped later anyway, skip them here
+            valid = pc.and_(
+                batch.column('user_id').is_valid(),
+                batch.column('anime_id').is_valid()
+            )
+            batch = batch.filter(valid)
+            batch_user = batch.column('user_id').to_numpy()
+            batch_anime = batch.column('anime_id').to_numpy()
+            batch_rating = batch.column('rating').fill_null(-1).to_numpy()
+            
+            # Fill the reservoir first
+            fill = min(max(sample_size - seen, 0), len(batch_user))
+            user_ids[seen:seen + fill] = batch_user[:fill]
+            anime_ids[seen:seen + fill] = batch_anime[:fill]
+            ratings[seen:seen + fill] = batch_rating[:fill]
+            
+            # Row i (1-based) replaces a random slot with probability sample_size / i
+            positions = np.arange(seen + fill + 1, seen + len(batch_user) + 1)
+            slots = rng.integers(0, positions)
+            keep = slots < sample_size
+            rows = fill + np.flatnonzero(keep)
+            user_ids[slots[keep]] = batch_user[rows]
+            anime_ids[slots[keep]] = batch_anime[rows]
+            ratings[slots[keep]] = batch_rating[rows]
+            
+            seen += len(batch_user)
+        
+        size = min(seen, sample_size)
+        return pd.DataFrame({
+            'user_id': user_ids[:size],
+            'anime_id': anime_ids[:size],
+            'rating': ratings[:size]
+        })
+    
     def normalize_ratings(self, ratings_df: pd.DataFrame) -> pd.DataFrame:
         """
         Normalize ratings to 0-1 scale.
@@ -128,28 +225,65 @@ class DataCleaner:
         
         return df
     
-    def get_user_stats(self, ratings_df: pd.DataFrame) -> pd.DataFrame:
+    def _positive_rating_stats(
+        self,
+        ratings_df: pd.DataFrame,
+        key: str,
+        partner: str,
+        avg_name: str,
+        unique_name: str
+    ) -> pd.DataFrame:
         """
-        Calculate user statistics.
+        Aggregate positive ratings per key (multi-threaded with Polars if installed).
         
         Args:
             ratings_df: DataFrame with ratings
+            key: Column to group by
+            partner: The other id column, counted per group
+            avg_name: Output column name for the mean rating
+            unique_name: Output column name for the partner count
         
         Returns:
-            DataFrame with user statistics
+            DataFrame with [key, rating_count, avg_name, rating_std, unique_name]
         """
-        positive_ratings = ratings_df[ratings_df['rating'] > 0]
-        
-        stats = positive_ratings.groupby('user_id').agg({
-            'rating': ['count', 'mean', 'std'],
-            'anime_id': 'nunique'
-        }).reset_index()
+        # (user_id, anime_id) pairs are unique after cleaning, so size == nunique
+        if pl is not None:
+            return pl.from_pandas(ratings_df[[key, partner, 'rating']]).lazy().filter(
+                pl.col('rating') > 0
+            ).group_by(key).agg(
+                pl.len().cast(pl.Int64).alias('rating_count'),
+                pl.col('rating').mean().alias(avg_name),
+                pl.col('rating').std().fill_null(0).alias('rating_std'),
+                pl.len().cast(pl.Int64).alias(unique_name)
+            ).collect().to_pandas()
+        
+        stats = ratings_df.loc[ratings_df['rating'] > 0].groupby(
+            key, sort=False, observed=True
+        ).agg(
+            rating_count=('rating', 'size'),
+            **{avg_name: ('rating', 'mean')},
+            rating_std=('rating', 'std'),
+            **{unique_name: (partner, 'size')}
+        ).reset_index()
         
-        stats.columns = ['user_id', 'rating_count', 'avg_rating', 'rating_std', 'unique_anime']
         stats['rating_std'] = stats['rating_std'].fillna(0)
         
         return stats
     
+    def get_user_stats(self, ratings_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Calculate user statistics.
+        
+        Args:
+            ratings_df: DataFrame with ratings
+        
+        Returns:
+            DataFrame with user statistics
+        """
+        return self._positive_rating_stats(
+            ratings_df, 'user_id', 'anime_id', 'avg_rating', 'unique_anime'
+        )
+    
     def get_anime_stats(self, ratings_df: pd.DataFrame) -> pd.DataFrame:
         """
         Calculate anime statistics from ratings.
@@ -160,14 +294,6 @@ class DataCleaner:
         Returns:
             DataFrame with anime statistics
         """
-        positive_ratings = ratings_df[ratings_df['rating'] > 0]
-        
-        stats = positive_ratings.groupby('anime_id').agg({
-            'rating': ['count', 'mean', 'std'],
-            'user_id': 'nunique'
-        }).reset_index()
-        
-        stats.columns = ['anime_id', 'rating_count', 'avg_user_rating', 'rating_std', 'unique_users']
-        stats['rating_std'] = stats['rating_std'].fillna(0)
-        
-        return stats
+        return self._positive_rating_stats(
+            ratings_df, 'anime_id', 'user_id', 'avg_user_rating', 'unique_users'
+        )
@@ -1,11 +1,11 @@
 """
 Data Collector Module.
-Downloads anime dataset from Kaggle using kagglehub or curl.
+Downloads anime dataset from Kaggle using kagglehub or a streamed HTTP download.
 Does NOT require Kaggle API credentials.
 """
 
+import asyncio
 import os
-import subprocess
 import zipfile
 import shutil
 from pathlib import Path
@@ -16,6 +16,12 @@ logger = logging.getLogger(__name__)
 DATASET_URL = "https://www.kaggle.com/api/v1/datasets/download/CooperUnion/anime-recommendations-database"
 DATASET_NAME = "CooperUnion/anime-recommendations-database"
 
+# Copy buffer used when extracting the dataset zip
+EXTRACT_CHUNK_SIZE = 1 << 20
+
+# Chunk size for the streamed dataset download
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
 
 class DataCollector:
     """Handles downloading and extracting the anime dataset."""
@@ -59,9 +65,44 @@ class DataCollector:
             print(f"Failed to download with kagglehub: {e}")
             return False
     
-    def download_with_curl(self, output_path: str = None) -> bool:
+    async def _stream_download(self, output_path: str, max_retries: int = 3) -> None:
         """
-        Download dataset using curl.
+        Stream the dataset zip to disk, resuming partial downloads.
+        
+        Args:
+            output_path: Path for the zip file
+            max_retries: Attempts before giving up
+        """
+        import aiohttp
+        
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=60)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            for attempt in range(1, max_retries + 1):
+                # Resume from what is already on disk
+                existing_size = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+                headers = {"Range": f"bytes={existing_size}-"} if existing_size else {}
+                
+                try:
+                    async with session.get(DATASET_URL, headers=headers) as response:
+                        if response.status == 416:
+                            # Requested range starts at the end, file is complete
+                            return
+                        response.raise_for_status()
+                        
+                        # Server ignored the range, start over
+                        mode = 'ab' if response.status == 206 else 'wb'
+                        with open(output_path, mode) as f:
+                            async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                                await asyncio.to_thread(f.write, chunk)
+                    return
+                except aiohttp.ClientError as e:
+                    if attempt == max_retries:
+                        raise
+                    logger.warning(f"Download interrupted ({e}), resuming (attempt {attempt + 1})")
+    
+    def download_with_http(self, output_path: str = None) -> bool:
+        """
+        Download dataset over HTTP with aiohttp, streaming straight to disk.
         
         Args:
             output_path: Optional path for the zip file
@@ -73,19 +114,8 @@ class DataCollector:
             output_path = str(self.data_dir / "anime-recommendations-database.zip")
         
         try:
-            print(f"Downloading dataset using curl to {output_path}...")
-            
-            # Run curl command
-            result = subprocess.run(
-                ["curl", "-L", "-o", output_path, DATASET_URL],
-                capture_output=True,
-                text=True
-            )
-            
-            if result.returncode != 0:
-                logger.error(f"curl failed: {result.stderr}")
-                print(f"curl failed: {result.stderr}")
-                return False
+            print(f"Downloading dataset to {output_path}...")
+            asyncio.run(self._stream_download(output_path))
             
             # Extract the zip file
             if self.extract_zip(output_path):
@@ -93,13 +123,13 @@ class DataCollector:
                 return True
             return False
             
-        except FileNotFoundError:
-            logger.error("curl not found. Please install curl or use kagglehub method.")
-            print("curl not found. Please install curl or use kagglehub method.")
+        except ImportError:
+            logger.error("aiohttp not installed. Install with: pip install aiohttp")
+            print("aiohttp not installed. Install with: pip install aiohttp")
             return False
         except Exception as e:
-            logger.error(f"Failed to download with curl: {e}")
-            print(f"Failed to download with curl: {e}")
+            logger.error(f"Failed to download over HTTP: {e}")
+            print(f"Failed to download over HTTP: {e}")
             return False
     
     def download(self, method: str = "kagglehub") -> bool:
@@ -107,17 +137,17 @@ class DataCollector:
         Download dataset using specified method.
         
         Args:
-            method: "kagglehub" or "curl"
+            method: "kagglehub" or "http" ("curl" is accepted as an alias)
         
         Returns:
             True if successful, False otherwise
         """
         if method == "kagglehub":
             return self.download_with_kagglehub()
-        elif method == "curl":
-            return self.download_with_curl()
+        elif method in ("http", "curl"):
+            return self.download_with_http()
         else:
-            raise ValueError(f"Unknown method: {method}. Use 'kagglehub' or 'curl'")
+            raise ValueError(f"Unknown method: {method}. Use 'kagglehub' or 'http'")
     
     def extract_zip(self, zip_path: str) -> bool:
         """
@@ -130,8 +160,21 @@ class DataCollector:
             True if successful, False otherwise
         """
         try:
+            data_dir = self.data_dir.resolve()
             with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(self.data_dir)
+                for member in zip_ref.infolist():
+                    if member.is_dir():
+                        continue
+                    
+                    # Refuse entries escaping the data directory
+                    target = (data_dir / member.filename).resolve()
+                    if data_dir not in target.parents:
+                        raise ValueError(f"Unsafe path in zip: {member.filename}")
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    
+                    # Stream in large blocks, CRC is still verified while reading
+                    with zip_ref.open(member) as src, open(target, 'wb') as dst:
+                        shutil.copyfileobj(src, dst, length=EXTRACT_CHUNK_SIZE)
             logger.info(f"Extracted {zip_path} to {self.data_dir}")
             
             # Remove zip file after extraction
@@ -164,7 +207,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Download anime dataset")
     parser.add_argument(
         "--method", 
-        choices=["kagglehub", "curl"], 
+        choices=["kagglehub", "http", "curl"], 
         default="kagglehub",
         help="Download method (default: kagglehub)"
     )
@@ -2,9 +2,12 @@
 Database module initialization.
 """
 
-from app.database.mongodb import Database, Collections, get_database
+from app.database.mongodb import (
+    Database, Collections, CollectionHandles, get_collections, get_database, fast_count
+)
+from app.database.cache import Cache, redis_cache
 from app.database.schemas import (
-    AnimeBase, AnimeInDB, AnimeResponse, AnimeDetail,
+    AnimeBase, AnimeInDB, AnimeResponse, AnimeDetail, to_anime_response,
     RatingBase, RatingInDB, RatingCreate, RatingResponse,
     UserBase, UserInDB, UserProfile,
     UserHistoryBase, UserHistoryInDB,
@@ -15,8 +18,13 @@ from app.database.schemas import (
 __all__ = [
     "Database",
     "Collections", 
+    "CollectionHandles",
+    "get_collections",
     "get_database",
-    "AnimeBase", "AnimeInDB", "AnimeResponse", "AnimeDetail",
+    "fast_count",
+    "Cache",
+    "redis_cache",
+    "AnimeBase", "AnimeInDB", "AnimeResponse", "AnimeDetail", "to_anime_response",
     "RatingBase", "RatingInDB", "RatingCreate", "RatingResponse",
     "UserBase", "UserInDB", "UserProfile",
     "UserHistoryBase", "UserHistoryInDB",
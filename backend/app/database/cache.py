@@ -0,0 +1,144 @@
+"""
+Redis Cache Module.
+Provides an optional async Redis client for response caching.
+Every operation degrades to a cache miss when Redis is unavailable.
+"""
+
+from typing import Any, Callable, Optional
+import functools
+import logging
+
+import orjson
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Cache:
+    """Redis cache connection manager."""
+    
+    client = None
+    
+    @classmethod
+    async def connect(cls) -> None:
+        """Connect to Redis if a URL is configured."""
+        if not settings.redis_url:
+            logger.info("Redis not configured, response caching disabled")
+            return
+        
+        try:
+            import redis.asyncio as redis
+            
+            cls.client = redis.from_url(
+                settings.redis_url,
+                socket_timeout=0.5,
+                socket_connect_timeout=0.5
+            )
+            await cls.client.ping()
+            logger.info("Connected to Redis")
+        except ImportError:
+            logger.warning("redis not installed. Install with: pip install redis")
+            cls.client = None
+        except Exception as e:
+            logger.warning(f"Failed to connect to Redis, caching disabled: {e}")
+            cls.client = None
+    
+    @classmethod
+    async def disconnect(cls) -> None:
+        """Disconnect from Redis."""
+        if cls.client is not None:
+            await cls.client.aclose()
+            cls.client = None
+            logger.info("Disconnected from Redis")
+    
+    @classmethod
+    async def get_bytes(cls, key: str) -> Optional[bytes]:
+        """Get a cached serialized value, or None on miss."""
+        if cls.client is None:
+            return None
+        try:
+            return await cls.client.get(key)
+        except Exception as e:
+            logger.warning(f"Redis GET failed for {key}: {e}")
+            return None
+    
+    @classmethod
+    async def get_json(cls, key: str) -> Optional[Any]:
+        """Get a cached JSON value, or None on miss."""
+        data = await cls.get_bytes(key)
+        return orjson.loads(data) if data is not None else None
+    
+    @classmethod
+    async def set_json(cls, key: str, value: Any, ttl: int) -> None:
+        """Cache a JSON-serializable value for ttl seconds."""
+        if cls.client is None:
+            return
+        try:
+            await cls.client.set(key, orjson.dumps(jsonable_encoder(value)), ex=ttl)
+        except Exception as e:
+            logger.warning(f"Redis SET failed for {key}: {e}")
+    
+    @classmethod
+    async def get_version(cls, key: str) -> int:
+        """Get an integer version stamp, 0 when missing."""
+        if cls.client is None:
+            return 0
+        try:
+            value = await cls.client.get(key)
+            return int(value) if value is not None else 0
+        except Exception as e:
+            logger.warning(f"Redis GET failed for {key}: {e}")
+            return 0
+    
+    @classmethod
+    async def bump_version(cls, key: str) -> None:
+        """Atomically increment a version stamp, invalidating keys built on it."""
+        if cls.client is None:
+            return
+        try:
+            await cls.client.incr(key)
+        except Exception as e:
+            logger.warning(f"Redis INCR failed for {key}: {e}")
+    
+    @classmethod
+    async def delete(cls, *keys: str) -> None:
+        """Delete cached keys."""
+        if cls.client is None or not keys:
+            return
+        try:
+            await cls.client.delete(*keys)
+        except Exception as e:
+            logger.warning(f"Redis DELETE failed for {keys}: {e}")
+
+
+def redis_cache(key_fn: Callable[..., str], ttl: int = 300):
+    """
+    Cache an async endpoint's JSON result in Redis.
+    
+    Hits return the stored bytes as-is, skipping validation and serialization.
+    
+    Args:
+        key_fn: Builds the cache key from the endpoint's keyword arguments
+        ttl: Time-to-live in seconds
+    
+    Returns:
+        Decorator for async functions
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(**kwargs):
+            key = key_fn(**kwargs)
+            cached = await Cache.get_bytes(key)
+            if cached is not None:
+                return Response(content=cached, media_type="application/json")
+            
+            result = await func(**kwargs)
+            await Cache.set_json(key, result, ttl)
+            return result
+        
+        return wrapper
+    
+    return decorator
@@ -3,7 +3,9 @@ MongoDB Database Connection Module.
 Provides async MongoDB client and database access.
 """
 
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, TEXT
+from dataclasses import dataclass
 from typing import Optional
 import logging
 
@@ -17,21 +19,94 @@ class Database:
     
     client: Optional[AsyncIOMotorClient] = None
     db: Optional[AsyncIOMotorDatabase] = None
+    collections: Optional["CollectionHandles"] = None
     
     @classmethod
-    async def connect(cls) -> None:
-        """Connect to MongoDB."""
+    async def connect(cls, **client_options) -> None:
+        """
+        Connect to MongoDB.
+        
+        Args:
+            client_options: Overrides for the configured client options
+        """
         try:
-            cls.client = AsyncIOMotorClient(settings.mongodb_url)
+            options = {
+                "maxPoolSize": settings.mongo_max_pool,
+                "minPoolSize": settings.mongo_min_pool,
+                "maxIdleTimeMS": settings.mongo_idle_ms,
+                "compressors": settings.mongo_compressors,
+                **client_options
+            }
+            cls.client = AsyncIOMotorClient(settings.mongodb_url, **options)
             cls.db = cls.client[settings.mongodb_database]
+            cls.collections = None
             
             # Verify connection
             await cls.client.admin.command("ping")
             logger.info(f"Connected to MongoDB: {settings.mongodb_database}")
+            
+            # Resolve collection handles once, before serving requests
+            get_collections()
         except Exception as e:
             logger.error(f"Failed to connect to MongoDB: {e}")
             raise
     
+    @classmethod
+    async def ensure_indexes(cls) -> None:
+        """Create indexes required by the API queries."""
+        db = cls.get_db()
+        animes_col = db[Collections.ANIMES]
+        
+        # Lookups by id
+        await animes_col.create_index("anime_id", unique=True)
+        await db[Collections.USERS].create_index("user_id", unique=True)
+        
+        # Listing filtered by type (equality prefix), sorted with _id as the keyset
+        # pagination tie-breaker; unfiltered listing needs its own indexes below
+        await animes_col.create_index([("type", ASCENDING), ("rating", DESCENDING), ("_id", DESCENDING)])
+        await animes_col.create_index([("type", ASCENDING), ("members", DESCENDING), ("_id", DESCENDING)])
+        await animes_col.create_index([("type", ASCENDING), ("name", ASCENDING), ("_id", ASCENDING)])
+        
+        # Unfiltered listing (default browse page), same sorts without the type prefix
+        await animes_col.create_index([("rating", DESCENDING), ("_id", DESCENDING)])
+        await animes_col.create_index([("members", DESCENDING), ("_id", DESCENDING)])
+        await animes_col.create_index([("name", ASCENDING), ("_id", ASCENDING)])
+        
+        # Top anime; the popularity sort is served by the (members, _id) prefix above
+        await animes_col.create_index([("rating", DESCENDING), ("members", DESCENDING)])
+        
+        # Genre-based recommendations and similar anime (multikey over the genre array)
+        await animes_col.create_index("genre")
+        
+        # Rating histogram / average aggregates
+        ratings_col = db[Collections.RATINGS]
+        await ratings_col.create_index([("rating", ASCENDING)])
+        
+        # A user's rating of an anime, and their paginated rating history
+        await ratings_col.create_index([("user_id", ASCENDING), ("anime_id", ASCENDING)], unique=True)
+        await ratings_col.create_index(
+            [("user_id", ASCENDING), ("rating", ASCENDING), ("timestamp", DESCENDING)]
+        )
+        
+        # User watch history ordered by time
+        await db[Collections.USER_HISTORY].create_index(
+            [("user_id", ASCENDING), ("timestamp", DESCENDING), ("action", ASCENDING)]
+        )
+        
+        # Model list ordered by training time
+        await db[Collections.MODEL_METRICS].create_index([("trained_at", DESCENDING)])
+        
+        # Case-insensitive name prefix search (anchored regex on the lowercased name)
+        await animes_col.create_index("name_lower")
+        
+        # Text index for anime search (no stemming, titles are not English prose)
+        await animes_col.create_index(
+            [("name", TEXT), ("japanese_name", TEXT)],
+            name="anime_text_search",
+            default_language="none"
+        )
+        logger.info("Ensured MongoDB indexes")
+    
     @classmethod
     async def disconnect(cls) -> None:
         """Disconnect from MongoDB."""
@@ -60,6 +135,43 @@ class Collections:
     USERS = "users"
     USER_HISTORY = "user_history"
     MODEL_METRICS = "model_metrics"
+    DASHBOARD_CACHE = "dashboard_cache"
+
+
+@dataclass(frozen=True)
+class CollectionHandles:
+    """Resolved collection handles for the current connection."""
+    animes: AsyncIOMotorCollection
+    ratings: AsyncIOMotorCollection
+    users: AsyncIOMotorCollection
+    user_history: AsyncIOMotorCollection
+    model_metrics: AsyncIOMotorCollection
+    dashboard_cache: AsyncIOMotorCollection
+
+
+def get_collections() -> CollectionHandles:
+    """Get collection handles, resolved once per connection."""
+    if Database.collections is None:
+        db = Database.get_db()
+        Database.collections = CollectionHandles(
+            animes=db[Collections.ANIMES],
+            ratings=db[Collections.RATINGS],
+            users=db[Collections.USERS],
+            user_history=db[Collections.USER_HISTORY],
+            model_metrics=db[Collections.MODEL_METRICS],
+            dashboard_cache=db[Collections.DASHBOARD_CACHE]
+        )
+    return Database.collections
+
+
+async def fast_count(collection, query: Optional[dict] = None) -> int:
+    """
+    Count documents in a collection.
+    Unfiltered counts use collection metadata instead of scanning.
+    """
+    if not query:
+        return await collection.estimated_document_count()
+    return await collection.count_documents(query)
 
 
 # Dependency for FastAPI
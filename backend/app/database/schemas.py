@@ -2,26 +2,23 @@
 Pydantic schemas for MongoDB documents.
 """
 
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, BeforeValidator, Field
+from typing import Annotated, List, Optional
 from datetime import datetime
 from bson import ObjectId
 
 
-class PyObjectId(str):
-    """Custom type for MongoDB ObjectId."""
-    
-    @classmethod
-    def __get_validators__(cls):
-        yield cls.validate
-    
-    @classmethod
-    def validate(cls, v):
-        if isinstance(v, ObjectId):
-            return str(v)
-        if isinstance(v, str) and ObjectId.is_valid(v):
-            return v
-        raise ValueError("Invalid ObjectId")
+def validate_object_id(v):
+    """Accept an ObjectId or its string form, stored as str."""
+    if isinstance(v, ObjectId):
+        return str(v)
+    if isinstance(v, str) and ObjectId.is_valid(v):
+        return v
+    raise ValueError("Invalid ObjectId")
+
+
+# MongoDB ObjectId as a str field (compiled into the pydantic-core schema)
+PyObjectId = Annotated[str, BeforeValidator(validate_object_id)]
 
 
 # ============= Anime Schemas =============
@@ -42,6 +39,7 @@ class AnimeInDB(AnimeBase):
     id: Optional[PyObjectId] = Field(default=None, alias="_id")
     genre_vector: Optional[List[float]] = None
     embedding: Optional[List[float]] = None
+    rating_count: int = 0
     
     class Config:
         populate_by_name = True
@@ -56,6 +54,20 @@ class AnimeResponse(AnimeBase):
         from_attributes = True
 
 
+def to_anime_response(doc: dict) -> AnimeResponse:
+    """Build an AnimeResponse from a trusted anime document, skipping validation."""
+    return AnimeResponse.model_construct(
+        id=str(doc["_id"]),
+        anime_id=doc.get("anime_id"),
+        name=doc.get("name", ""),
+        genre=doc.get("genre", []),
+        type=doc.get("type", ""),
+        episodes=doc.get("episodes", 0),
+        rating=doc.get("rating", 0.0),
+        members=doc.get("members", 0)
+    )
+
+
 class AnimeDetail(AnimeResponse):
     """Detailed anime response with additional fields."""
     japanese_name: Optional[str] = None
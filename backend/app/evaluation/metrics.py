@@ -10,6 +10,26 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# DCG discount 1 / log2(position + 1) for positions 1..1024
+_LOG2_INV = 1.0 / np.log2(np.arange(2, 1026))
+
+# Ideal DCG for n relevant items at the top, _IDCG_CUM[n], n = 0..1024
+_IDCG_CUM = np.concatenate(([0.0], np.cumsum(_LOG2_INV)))
+
+
+def _discounts(n: int) -> np.ndarray:
+    """DCG discounts for the first n positions."""
+    if n <= len(_LOG2_INV):
+        return _LOG2_INV[:max(n, 0)]
+    return 1.0 / np.log2(np.arange(2, n + 2))
+
+
+def _ideal_dcg(n: int) -> float:
+    """DCG of n relevant items ranked first."""
+    if n < len(_IDCG_CUM):
+        return float(_IDCG_CUM[max(n, 0)])
+    return float(_discounts(n).sum())
+
 
 def rmse(predictions: List[Tuple[float, float]]) -> float:
     """
@@ -24,8 +44,9 @@ def rmse(predictions: List[Tuple[float, float]]) -> float:
     if not predictions:
         return 0.0
     
-    squared_errors = [(actual - predicted) ** 2 for actual, predicted in predictions]
-    return np.sqrt(np.mean(squared_errors))
+    pairs = np.asarray(predictions, dtype=np.float64)
+    diff = pairs[:, 0] - pairs[:, 1]
+    return float(np.sqrt(np.mean(diff * diff)))
 
 
 def mae(predictions: List[Tuple[float, float]]) -> float:
@@ -41,8 +62,22 @@ def mae(predictions: List[Tuple[float, float]]) -> float:
     if not predictions:
         return 0.0
     
-    absolute_errors = [abs(actual - predicted) for actual, predicted in predictions]
-    return np.mean(absolute_errors)
+    pairs = np.asarray(predictions, dtype=np.float64)
+    return float(np.mean(np.abs(pairs[:, 0] - pairs[:, 1])))
+
+
+def _precision_from_sets(recommended_k: set, relevant_set: set, k: int) -> float:
+    """Precision@K from a prepared top-K set and relevant set."""
+    if k <= 0 or not recommended_k:
+        return 0.0
+    return len(recommended_k & relevant_set) / k
+
+
+def _recall_from_sets(recommended_k: set, relevant_set: set) -> float:
+    """Recall@K from a prepared top-K set and relevant set."""
+    if not relevant_set:
+        return 0.0
+    return len(recommended_k & relevant_set) / len(relevant_set)
 
 
 def precision_at_k(recommended: List[int], relevant: List[int], k: int) -> float:
@@ -60,14 +95,7 @@ def precision_at_k(recommended: List[int], relevant: List[int], k: int) -> float
     if k <= 0:
         return 0.0
     
-    recommended_k = set(recommended[:k])
-    relevant_set = set(relevant)
-    
-    if not recommended_k:
-        return 0.0
-    
-    hits = len(recommended_k & relevant_set)
-    return hits / k
+    return _precision_from_sets(set(recommended[:k]), set(relevant), k)
 
 
 def recall_at_k(recommended: List[int], relevant: List[int], k: int) -> float:
@@ -85,11 +113,7 @@ def recall_at_k(recommended: List[int], relevant: List[int], k: int) -> float:
     if not relevant:
         return 0.0
     
-    recommended_k = set(recommended[:k])
-    relevant_set = set(relevant)
-    
-    hits = len(recommended_k & relevant_set)
-    return hits / len(relevant_set)
+    return _recall_from_sets(set(recommended[:k]), set(relevant))
 
 
 def f1_at_k(recommended: List[int], relevant: List[int], k: int) -> float:
@@ -104,8 +128,11 @@ def f1_at_k(recommended: List[int], relevant: List[int], k: int) -> float:
     Returns:
         F1@K value
     """
-    p = precision_at_k(recommended, relevant, k)
-    r = recall_at_k(recommended, relevant, k)
+    # Build the sets once for both metrics
+    recommended_k = set(recommended[:k]) if k > 0 else set()
+    relevant_set = set(relevant)
+    p = _precision_from_sets(recommended_k, relevant_set, k)
+    r = _recall_from_sets(recommended_k, relevant_set)
     
     if p + r == 0:
         return 0.0
@@ -129,17 +156,18 @@ def ndcg_at_k(recommended: List[int], relevant: List[int], k: int) -> float:
         return 0.0
     
     relevant_set = set(relevant)
+    recommended_k = recommended[:k]
     
-    # Calculate DCG
-    dcg = 0.0
-    for i, item in enumerate(recommended[:k]):
-        if item in relevant_set:
-            # Using binary relevance (1 if relevant, 0 otherwise)
-            dcg += 1.0 / np.log2(i + 2)  # +2 because positions start at 1
+    # Calculate DCG (binary relevance: 1 if relevant, 0 otherwise)
+    hits = np.fromiter(
+        (item in relevant_set for item in recommended_k),
+        dtype=bool,
+        count=len(recommended_k)
+    )
+    dcg = float(_discounts(len(recommended_k))[hits].sum())
     
     # Calculate ideal DCG (all relevant items at top)
-    ideal_length = min(k, len(relevant))
-    idcg = sum(1.0 / np.log2(i + 2) for i in range(ideal_length))
+    idcg = _ideal_dcg(min(k, len(relevant)))
     
     if idcg == 0:
         return 0.0
@@ -182,29 +210,30 @@ def diversity(recommended: List[int], item_features: Dict[int, List[str]]) -> fl
     if len(recommended) < 2:
         return 0.0
     
-    total_dissimilarity = 0
-    pair_count = 0
-    
-    for i in range(len(recommended)):
-        for j in range(i + 1, len(recommended)):
-            item1 = recommended[i]
-            item2 = recommended[j]
-            
-            if item1 in item_features and item2 in item_features:
-                features1 = set(item_features[item1])
-                features2 = set(item_features[item2])
-                
-                if features1 | features2:
-                    # Jaccard dissimilarity
-                    similarity = len(features1 & features2) / len(features1 | features2)
-                    dissimilarity = 1 - similarity
-                    total_dissimilarity += dissimilarity
-            else:
-                total_dissimilarity += 0.5  # Default for missing features
-            
-            pair_count += 1
-    
-    return total_dissimilarity / pair_count if pair_count > 0 else 0.0
+    # Item x feature membership matrix (rows of missing items stay empty)
+    k = len(recommended)
+    present = np.array([item in item_features for item in recommended])
+    feature_ids: Dict[str, int] = {}
+    rows, cols = [], []
+    for i, item in enumerate(recommended):
+        for feature in set(item_features.get(item, ())):
+            rows.append(i)
+            cols.append(feature_ids.setdefault(feature, len(feature_ids)))
+    membership = np.zeros((k, max(len(feature_ids), 1)), dtype=np.int32)
+    membership[rows, cols] = 1
+    
+    # Pairwise Jaccard dissimilarity
+    intersection = membership @ membership.T
+    sizes = membership.sum(axis=1)
+    union = sizes[:, None] + sizes[None, :] - intersection
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dissimilarity = np.where(union > 0, 1 - intersection / union, 0.0)
+    
+    # Default for pairs with missing features
+    dissimilarity = np.where(present[:, None] & present[None, :], dissimilarity, 0.5)
+    
+    upper = np.triu_indices(k, 1)
+    return float(dissimilarity[upper].mean())
 
 
 class Evaluator:
@@ -220,6 +249,10 @@ class Evaluator:
         """
         self.k = k
         self.threshold = threshold
+        
+        # DCG position discounts and cumulative ideal DCG, computed once
+        self.discount = _discounts(k)
+        self.idcg = np.array([_ideal_dcg(n) for n in range(k + 1)])
     
     def evaluate_rating_predictions(
         self,
@@ -254,26 +287,51 @@ class Evaluator:
         Returns:
             Dictionary of average metrics across users
         """
-        precisions = []
-        recalls = []
-        f1s = []
-        ndcgs = []
+        k = self.k
+        users = [u for u in user_recommendations if u in user_relevant]
+        if not users:
+            return {
+                f'precision@{k}': 0.0,
+                f'recall@{k}': 0.0,
+                f'f1@{k}': 0.0,
+                f'ndcg@{k}': 0.0
+            }
         
-        for user_id in user_recommendations:
-            if user_id not in user_relevant:
-                continue
-            
-            recs = user_recommendations[user_id]
+        # (users x k) hit matrix, plus a mask of first occurrences for set-based counts
+        hits = np.zeros((len(users), k), dtype=np.float64)
+        first = np.zeros((len(users), k), dtype=bool)
+        n_relevant = np.zeros(len(users), dtype=np.float64)
+        n_relevant_unique = np.zeros(len(users), dtype=np.float64)
+        for row, user_id in enumerate(users):
             relevant = user_relevant[user_id]
+            relevant_set = frozenset(relevant)
+            n_relevant[row] = len(relevant)
+            n_relevant_unique[row] = len(relevant_set)
+            
+            seen = set()
+            for col, item in enumerate(user_recommendations[user_id][:k]):
+                if item in relevant_set:
+                    hits[row, col] = 1.0
+                    first[row, col] = item not in seen
+                seen.add(item)
+        
+        unique_hits = (hits * first).sum(axis=1)
+        precisions = unique_hits / k
+        with np.errstate(divide='ignore', invalid='ignore'):
+            recalls = np.where(n_relevant_unique > 0, unique_hits / n_relevant_unique, 0.0)
+            f1s = np.where(
+                precisions + recalls > 0,
+                2 * precisions * recalls / (precisions + recalls),
+                0.0
+            )
             
-            precisions.append(precision_at_k(recs, relevant, self.k))
-            recalls.append(recall_at_k(recs, relevant, self.k))
-            f1s.append(f1_at_k(recs, relevant, self.k))
-            ndcgs.append(ndcg_at_k(recs, relevant, self.k))
+            # Ideal DCG puts min(k, |relevant|) hits at the top
+            idcg = self.idcg[np.minimum(k, n_relevant).astype(int)]
+            ndcgs = np.where(idcg > 0, (hits @ self.discount) / idcg, 0.0)
         
         return {
-            f'precision@{self.k}': np.mean(precisions) if precisions else 0.0,
-            f'recall@{self.k}': np.mean(recalls) if recalls else 0.0,
-            f'f1@{self.k}': np.mean(f1s) if f1s else 0.0,
-            f'ndcg@{self.k}': np.mean(ndcgs) if ndcgs else 0.0
+            f'precision@{k}': float(precisions.mean()),
+            f'recall@{k}': float(recalls.mean()),
+            f'f1@{k}': float(f1s.mean()),
+            f'ndcg@{k}': float(ndcgs.mean())
         }
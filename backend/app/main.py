@@ -6,10 +6,12 @@ Anime Recommendation System Backend.
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+import asyncio
 import logging
 
 from app.config import settings
-from app.database import Database
+from app.database import Database, Cache
 from app.api import auth, anime, recommendation, user, admin
 
 # Configure logging
@@ -26,12 +28,17 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting Anime Recommendation API...")
     await Database.connect()
+    await Database.ensure_indexes()
+    await Cache.connect()
+    dashboard_task = asyncio.create_task(admin.dashboard_refresh_loop())
     logger.info("Application started successfully")
     
     yield
     
     # Shutdown
     logger.info("Shutting down...")
+    dashboard_task.cancel()
+    await Cache.disconnect()
     await Database.disconnect()
     logger.info("Application shut down")
 
@@ -42,6 +49,7 @@ app = FastAPI(
     description="AI-powered anime recommendation system with collaborative and content-based filtering",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/docs",
     redoc_url="/redoc"
 )
@@ -4,14 +4,104 @@ Abstract base class for all recommendation models.
 """
 
 from abc import ABC, abstractmethod
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from pathlib import Path
 import pickle
 import logging
 
+import numpy as np
+from scipy.sparse import csr_matrix
+
 logger = logging.getLogger(__name__)
 
 
+def top_n_indices(values: np.ndarray, n: int) -> np.ndarray:
+    """
+    Indices of the n largest values, in descending order.
+    
+    Uses a linear-time partition and only sorts the selected n. Ties keep
+    positional order, like a stable descending sort.
+    
+    Args:
+        values: 1-D array of scores
+        n: Number of indices to return
+    
+    Returns:
+        Array of at most n indices
+    """
+    n = min(n, values.size)
+    if n <= 0:
+        return np.empty(0, dtype=np.intp)
+    if n < values.size:
+        # n-th largest value; ties at the boundary go to the lowest positions
+        kth = np.partition(values, values.size - n)[values.size - n]
+        above = np.flatnonzero(values > kth)
+        ties = np.flatnonzero(values == kth)[:n - above.size]
+        idx = np.sort(np.concatenate([above, ties]))
+    else:
+        idx = np.arange(values.size)
+    return idx[np.argsort(-values[idx], kind='stable')]
+
+
+def top_k_per_row(matrix: csr_matrix, k: int) -> csr_matrix:
+    """
+    Keep only the k largest positive values in each row of a sparse matrix.
+    
+    Args:
+        matrix: Sparse matrix (e.g. item-item similarities)
+        k: Number of values to keep per row
+    
+    Returns:
+        New CSR matrix with at most k nonzeros per row
+    """
+    matrix = csr_matrix(matrix, copy=True)
+    matrix.data[matrix.data < 0] = 0
+    matrix.eliminate_zeros()
+    
+    indptr, data = matrix.indptr, matrix.data
+    keep = np.ones(len(data), dtype=bool)
+    for row in np.flatnonzero(np.diff(indptr) > k):
+        start, end = indptr[row], indptr[row + 1]
+        drop = np.argpartition(-data[start:end], k)[k:]
+        keep[start + drop] = False
+    
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(indptr))
+    return csr_matrix(
+        (data[keep], (rows[keep], matrix.indices[keep])),
+        shape=matrix.shape
+    )
+
+
+def build_rating_matrix(ratings: List[Dict]) -> Tuple[csr_matrix, List[int], List[int]]:
+    """
+    Build a sparse users x items rating matrix in vectorized form.
+    
+    Only positive ratings become entries; every user and anime still gets
+    a row/column.
+    
+    Args:
+        ratings: List of rating dictionaries with 'user_id', 'anime_id', 'rating'
+    
+    Returns:
+        Tuple of (rating matrix, sorted user IDs, sorted anime IDs)
+    """
+    count = len(ratings)
+    user_ids = np.fromiter((r['user_id'] for r in ratings), dtype=np.int64, count=count)
+    anime_ids = np.fromiter((r['anime_id'] for r in ratings), dtype=np.int64, count=count)
+    # Ratings are small integers; float32 halves the bytes every sparse product moves
+    values = np.fromiter((r['rating'] for r in ratings), dtype=np.float32, count=count)
+    
+    users, user_idx = np.unique(user_ids, return_inverse=True)
+    items, item_idx = np.unique(anime_ids, return_inverse=True)
+    
+    rated = values > 0  # Only use actual ratings
+    matrix = csr_matrix(
+        (values[rated], (user_idx[rated], item_idx[rated])),
+        shape=(len(users), len(items))
+    )
+    return matrix, users.tolist(), items.tolist()
+
+
 class BaseRecommender(ABC):
     """Abstract base class for recommendation models."""
     
@@ -53,6 +143,21 @@ class BaseRecommender(ABC):
         """
         pass
     
+    def predict_batch(self, user_ids: List[int], n: int = 10) -> List[List[int]]:
+        """
+        Get recommendations for several users.
+        
+        Models that can score users together override this.
+        
+        Args:
+            user_ids: User IDs
+            n: Number of recommendations per user
+        
+        Returns:
+            List of recommended anime ID lists, aligned with user_ids
+        """
+        return [self.predict(user_id, n=n) for user_id in user_ids]
+    
     @abstractmethod
     def predict_rating(self, user_id: int, anime_id: int) -> float:
         """
@@ -67,6 +172,21 @@ class BaseRecommender(ABC):
         """
         pass
     
+    def predict_ratings(self, user_id: int, anime_ids: List[int]) -> List[float]:
+        """
+        Predict ratings for several anime of one user.
+        
+        Models with per-user setup (e.g. neighbor lookup) override this to share it.
+        
+        Args:
+            user_id: User ID
+            anime_ids: Anime IDs
+        
+        Returns:
+            Predicted ratings, aligned with anime_ids
+        """
+        return [self.predict_rating(user_id, anime_id) for anime_id in anime_ids]
+    
     def save(self, path: str) -> None:
         """
         Save model to disk.
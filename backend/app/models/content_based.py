@@ -5,11 +5,11 @@ Recommends anime based on content similarity (genres, type, etc.).
 
 from typing import List, Dict, Any, Optional
 import numpy as np
+from scipy.sparse import csr_matrix, vstack
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import logging
 
-from app.models.base_model import BaseRecommender
+from app.models.base_model import BaseRecommender, top_k_per_row, top_n_indices
 
 logger = logging.getLogger(__name__)
 
@@ -19,10 +19,17 @@ class ContentBasedRecommender(BaseRecommender):
     Content-based filtering using TF-IDF on genres.
     """
     
-    def __init__(self):
+    def __init__(self, k_neighbors: int = 50):
         super().__init__("Content-Based Filtering")
-        self.tfidf_vectorizer = TfidfVectorizer()
+        self.k_neighbors = k_neighbors
+        # Genres are already clean tokens: skip lowercasing and the default word regex
+        self.tfidf_vectorizer = TfidfVectorizer(
+            dtype=np.float32,
+            lowercase=False,
+            token_pattern=r"\S+"
+        )
         self.tfidf_matrix = None
+        self.similarity_topk: csr_matrix = None  # top-k similar anime per anime
         self.anime_ids: List[int] = []
         self.anime_id_to_idx: Dict[int, int] = {}
         self.anime_data: Dict[int, Dict] = {}
@@ -56,12 +63,64 @@ class ContentBasedRecommender(BaseRecommender):
         
         # Fit TF-IDF
         self.tfidf_matrix = self.tfidf_vectorizer.fit_transform(genre_strings)
+        self.tfidf_matrix.sort_indices()
+        
+        # Precompute top-k similar anime (increase threshold for larger catalogs)
+        n_anime = len(self.anime_ids)
+        if n_anime <= 20000:
+            logger.info(f"Computing top-{self.k_neighbors} content similarity ({n_anime} anime)...")
+            self.similarity_topk = self._compute_similarity_topk()
+        else:
+            self.similarity_topk = None
+            logger.warning(f"Catalog too large ({n_anime} anime) for precomputed similarity, will compute on-demand")
         
         self.is_fitted = True
         logger.info("Content-based model fitted successfully")
         
         return self
     
+    def _compute_similarity_topk(self, block_size: int = 1024) -> csr_matrix:
+        """
+        Compute the top-k similarity matrix in row blocks.
+        
+        Genres are shared widely, so a full anime x anime product is nearly
+        dense; pruning each block keeps peak memory at block_size rows.
+        """
+        n_anime = self.tfidf_matrix.shape[0]
+        # Transpose to CSR once instead of letting every block product convert it
+        tfidf_t = self.tfidf_matrix.T.tocsr()
+        blocks = [
+            # TF-IDF rows are already L2-normalized, so cosine similarity is a dot product
+            top_k_per_row(self.tfidf_matrix[start:start + block_size] @ tfidf_t, self.k_neighbors)
+            for start in range(0, n_anime, block_size)
+        ]
+        return vstack(blocks, format='csr') if blocks else csr_matrix((0, 0), dtype=np.float32)
+    
+    def _top_similar(self, indices: List[int], count: int) -> List[np.ndarray]:
+        """
+        Get the most similar anime for each given anime.
+        
+        Args:
+            indices: Anime indices
+            count: Number of similar anime per anime
+        
+        Returns:
+            One index array per anime, most similar first
+        """
+        similarity_topk = getattr(self, 'similarity_topk', None)
+        if similarity_topk is not None and count <= self.k_neighbors:
+            # Chỉ đọc các rows đã precompute
+            rows = similarity_topk[indices]
+            return [
+                rows.indices[start:end][top_n_indices(rows.data[start:end], count)]
+                for start, end in zip(rows.indptr[:-1], rows.indptr[1:])
+            ]
+        
+        # Similarities of all requested anime in one sparse product (anime x all anime)
+        # (all x requested).T keeps scipy from converting the whole matrix per call
+        similarities = (self.tfidf_matrix @ self.tfidf_matrix[indices].T).T.toarray()
+        return [top_n_indices(row, count) for row in similarities]
+    
     def get_similar_anime(self, anime_id: int, n: int = 20) -> List[int]:
         """
         Get anime similar to a given anime.
@@ -81,12 +140,8 @@ class ContentBasedRecommender(BaseRecommender):
         
         idx = self.anime_id_to_idx[anime_id]
         
-        # Sử dụng getrow() để giữ sparse format - hiệu quả hơn
-        anime_vector = self.tfidf_matrix.getrow(idx)
-        similarities = cosine_similarity(anime_vector, self.tfidf_matrix).ravel()
-        
         # Get top N similar (excluding self)
-        similar_indices = similarities.argsort()[::-1][1:n+1]
+        similar_indices = self._top_similar([idx], n + 1)[0][1:]
         
         return [self.anime_ids[i] for i in similar_indices]
     
@@ -108,17 +163,18 @@ class ContentBasedRecommender(BaseRecommender):
         if not liked_anime_ids:
             return []
         
-        # Get similar anime for each liked anime
-        recommendations = {}
-        for anime_id in liked_anime_ids:
-            similar = self.get_similar_anime(anime_id, n=20)
-            for sim_id in similar:
-                if sim_id not in liked_anime_ids:
-                    recommendations[sim_id] = recommendations.get(sim_id, 0) + 1
+        liked_indices = [self.anime_id_to_idx[aid] for aid in liked_anime_ids if aid in self.anime_id_to_idx]
+        if not liked_indices:
+            return []
+        
+        # Count how often each anime is among the top 20 similar of a liked anime
+        similar_indices = np.concatenate([similar[1:] for similar in self._top_similar(liked_indices, 21)])
+        counts = np.bincount(similar_indices, minlength=len(self.anime_ids))
+        counts[liked_indices] = 0
         
         # Sort by frequency and return top N
-        sorted_recs = sorted(recommendations.items(), key=lambda x: x[1], reverse=True)
-        return [aid for aid, _ in sorted_recs[:n]]
+        top_indices = top_n_indices(counts, n)
+        return [self.anime_ids[i] for i in top_indices if counts[i] > 0]
     
     def predict_rating(self, user_id: int, anime_id: int) -> float:
         """
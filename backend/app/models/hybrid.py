@@ -3,10 +3,11 @@ Hybrid Recommendation Model.
 Combines multiple recommendation approaches.
 """
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
 import logging
 
-from app.models.base_model import BaseRecommender
+from app.models.base_model import BaseRecommender, top_n_indices
 from app.models.content_based import ContentBasedRecommender
 from app.models.item_based import ItemBasedRecommender
 from app.models.user_based import UserBasedRecommender
@@ -47,8 +48,6 @@ class HybridRecommender(BaseRecommender):
         self.content_model: Optional[ContentBasedRecommender] = None
         self.item_cf_model: Optional[ItemBasedRecommender] = None
         self.user_cf_model: Optional[UserBasedRecommender] = None
-        
-        self.user_ratings: Dict[int, Dict[int, float]] = {}
     
     def fit(
         self,
@@ -67,14 +66,6 @@ class HybridRecommender(BaseRecommender):
         """
         logger.info("Fitting hybrid model...")
         
-        # Store user ratings for content-based recommendations
-        for r in ratings:
-            if r['rating'] > 0:
-                uid = r['user_id']
-                if uid not in self.user_ratings:
-                    self.user_ratings[uid] = {}
-                self.user_ratings[uid][r['anime_id']] = r['rating']
-        
         # Fit content-based model
         logger.info("Fitting content-based component...")
         self.content_model = ContentBasedRecommender()
@@ -95,6 +86,24 @@ class HybridRecommender(BaseRecommender):
         
         return self
     
+    def _get_user_ratings(self, user_id: int) -> Tuple[List[int], np.ndarray]:
+        """
+        Get a user's rated anime IDs and ratings from the item-based CF rating matrix.
+        
+        Args:
+            user_id: User ID
+        
+        Returns:
+            Tuple of (anime IDs, ratings), empty for unknown users
+        """
+        user_idx = self.item_cf_model.user_id_to_idx.get(user_id) if self.item_cf_model else None
+        if user_idx is None:
+            return [], np.empty(0)
+        
+        row = self.item_cf_model.rating_matrix.getrow(user_idx)
+        idx_to_anime_id = self.item_cf_model.idx_to_anime_id
+        return [idx_to_anime_id[idx] for idx in row.indices], row.data
+    
     def predict(self, user_id: int, n: int = 20) -> List[int]:
         """
         Get recommendations combining all models.
@@ -109,49 +118,104 @@ class HybridRecommender(BaseRecommender):
         if not self.is_fitted:
             raise RuntimeError("Model not fitted. Call fit() first.")
         
-        # Get recommendations from each model
-        recommendations = {}
+        item_recs = None
+        if self.item_cf_model:
+            try:
+                item_recs = self.item_cf_model.predict(user_id, n=n * 2)
+            except Exception as e:
+                logger.warning(f"Item-based CF failed: {e}")
+        
+        return self._combine_recommendations(user_id, n, item_recs)
+    
+    def predict_batch(self, user_ids: List[int], n: int = 20) -> List[List[int]]:
+        """
+        Get recommendations for several users.
+        
+        Item-based CF scores the whole batch at once; the other components
+        run per user.
+        
+        Args:
+            user_ids: User IDs
+            n: Number of recommendations per user
+        
+        Returns:
+            List of recommended anime ID lists, aligned with user_ids
+        """
+        if not self.is_fitted:
+            raise RuntimeError("Model not fitted. Call fit() first.")
+        
+        item_recs_batch = [None] * len(user_ids)
+        if self.item_cf_model:
+            try:
+                item_recs_batch = self.item_cf_model.predict_batch(user_ids, n=n * 2)
+            except Exception as e:
+                logger.warning(f"Item-based CF failed: {e}")
+        
+        return [
+            self._combine_recommendations(user_id, n, item_recs)
+            for user_id, item_recs in zip(user_ids, item_recs_batch)
+        ]
+    
+    def _combine_recommendations(self, user_id: int, n: int, item_recs: Optional[List[int]]) -> List[int]:
+        """
+        Combine component recommendations by weighted rank.
+        
+        Args:
+            user_id: User ID
+            n: Number of recommendations
+            item_recs: Item-based CF recommendations, None if unavailable
+        
+        Returns:
+            List of recommended anime IDs
+        """
+        # Get ranked recommendations from each model, with their weights
+        ranked = []
+        rated_ids, rated_values = self._get_user_ratings(user_id)
         
         # Content-based recommendations
-        if self.content_model and user_id in self.user_ratings:
+        if self.content_model and rated_ids:
             liked_anime = [
-                aid for aid, rating in self.user_ratings[user_id].items()
+                aid for aid, rating in zip(rated_ids, rated_values)
                 if rating >= 7
             ]
             if liked_anime:
                 content_recs = self.content_model.predict(user_id, n=n * 2, liked_anime_ids=liked_anime)
-                for i, anime_id in enumerate(content_recs):
-                    score = self.content_weight * (1 - i / len(content_recs))
-                    recommendations[anime_id] = recommendations.get(anime_id, 0) + score
+                ranked.append((content_recs, self.content_weight))
         
         # Item-based CF recommendations
-        if self.item_cf_model:
-            try:
-                item_recs = self.item_cf_model.predict(user_id, n=n * 2)
-                for i, anime_id in enumerate(item_recs):
-                    score = self.item_cf_weight * (1 - i / len(item_recs))
-                    recommendations[anime_id] = recommendations.get(anime_id, 0) + score
-            except Exception as e:
-                logger.warning(f"Item-based CF failed: {e}")
+        if item_recs:
+            ranked.append((item_recs, self.item_cf_weight))
         
         # User-based CF recommendations
         if self.user_cf_model:
             try:
                 user_recs = self.user_cf_model.predict(user_id, n=n * 2)
-                for i, anime_id in enumerate(user_recs):
-                    score = self.user_cf_weight * (1 - i / len(user_recs))
-                    recommendations[anime_id] = recommendations.get(anime_id, 0) + score
+                ranked.append((user_recs, self.user_cf_weight))
             except Exception as e:
                 logger.warning(f"User-based CF failed: {e}")
         
-        # Filter out already rated anime
-        rated = set(self.user_ratings.get(user_id, {}).keys())
-        recommendations = {k: v for k, v in recommendations.items() if k not in rated}
+        ranked = [(recs, weight) for recs, weight in ranked if recs]
+        if not ranked:
+            return []
         
-        # Sort by combined score
-        sorted_recs = sorted(recommendations.items(), key=lambda x: x[1], reverse=True)
+        # Score = weight * (1 - rank / len), summed per anime
+        anime_ids = np.concatenate([np.asarray(recs) for recs, _ in ranked])
+        scores = np.concatenate([
+            weight * (1 - np.arange(len(recs)) / len(recs)) for recs, weight in ranked
+        ])
+        unique_ids, first_seen, inverse = np.unique(anime_ids, return_index=True, return_inverse=True)
+        totals = np.bincount(inverse, weights=scores)
+        
+        # Keep first-seen order so equal scores rank as before
+        order = np.argsort(first_seen)
+        unique_ids, totals = unique_ids[order], totals[order]
+        
+        # Filter out already rated anime
+        not_rated = ~np.isin(unique_ids, rated_ids)
+        unique_ids, totals = unique_ids[not_rated], totals[not_rated]
         
-        return [anime_id for anime_id, _ in sorted_recs[:n]]
+        # Top N by combined score
+        return unique_ids[top_n_indices(totals, n)].tolist()
     
     def predict_rating(self, user_id: int, anime_id: int) -> float:
         """
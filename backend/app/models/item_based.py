@@ -4,12 +4,14 @@ Recommends anime based on item-item similarity.
 """
 
 from typing import List, Dict, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import os
 import numpy as np
 from scipy.sparse import csr_matrix
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 import logging
 
-from app.models.base_model import BaseRecommender
+from app.models.base_model import BaseRecommender, build_rating_matrix, top_k_per_row, top_n_indices
 
 logger = logging.getLogger(__name__)
 
@@ -23,12 +25,14 @@ class ItemBasedRecommender(BaseRecommender):
         super().__init__("Item-Based Collaborative Filtering")
         self.k_neighbors = k_neighbors
         self.popularity_weight = popularity_weight  # Weight for popularity bias
-        self.item_similarity: np.ndarray = None
+        self.item_similarity_topk: csr_matrix = None  # top-k neighbors per item
+        self.item_user_norm: csr_matrix = None  # L2-normalized item vectors for on-demand similarity
         self.rating_matrix: csr_matrix = None
         self.user_id_to_idx: Dict[int, int] = {}
         self.anime_id_to_idx: Dict[int, int] = {}
         self.idx_to_anime_id: Dict[int, int] = {}
         self.item_means: np.ndarray = None
+        self.item_popularity: np.ndarray = None  # rating mass per item, normalized 0-1
     
     def fit(self, ratings: List[Dict]) -> 'ItemBasedRecommender':
         """
@@ -42,55 +46,44 @@ class ItemBasedRecommender(BaseRecommender):
         """
         logger.info(f"Fitting item-based model with {len(ratings)} ratings")
         
-        # Build user and item mappings
-        users = sorted(set(r['user_id'] for r in ratings))
-        items = sorted(set(r['anime_id'] for r in ratings))
+        # Build sparse rating matrix (users x items) and ID mappings
+        self.rating_matrix, users, items = build_rating_matrix(ratings)
         
         self.user_id_to_idx = {uid: idx for idx, uid in enumerate(users)}
         self.anime_id_to_idx = {aid: idx for idx, aid in enumerate(items)}
         self.idx_to_anime_id = {idx: aid for aid, idx in self.anime_id_to_idx.items()}
         
-        n_users = len(users)
         n_items = len(items)
         
-        # Build sparse rating matrix (users x items)
-        row_indices = []
-        col_indices = []
-        values = []
-        
-        for r in ratings:
-            if r['rating'] > 0:  # Only use actual ratings
-                user_idx = self.user_id_to_idx[r['user_id']]
-                item_idx = self.anime_id_to_idx[r['anime_id']]
-                row_indices.append(user_idx)
-                col_indices.append(item_idx)
-                values.append(r['rating'])
-        
-        self.rating_matrix = csr_matrix(
-            (values, (row_indices, col_indices)),
-            shape=(n_users, n_items)
-        )
-        
         logger.info(f"Rating matrix shape: {self.rating_matrix.shape}")
         
         # Calculate item means
         item_sums = np.array(self.rating_matrix.sum(axis=0)).flatten()
-        item_counts = np.array((self.rating_matrix > 0).sum(axis=0)).flatten()
+        # Mọi entry đều là rating > 0, nên count = số nonzero mỗi cột
+        item_counts = np.bincount(self.rating_matrix.indices, minlength=n_items)
         self.item_means = np.divide(
             item_sums, item_counts,
             out=np.zeros_like(item_sums, dtype=float),
             where=item_counts > 0
         )
+        self.item_popularity = self._normalized_popularity(item_sums)
+        
+        # Transpose to get items x users, normalized once so cosine is a dot product.
+        # Kept after fit: predict_rating needs exact similarities to the user's
+        # rated items, not just each item's top-k list
+        item_user_norm = self.item_user_norm = self._normalize_items(self.rating_matrix)
         
         # Calculate item-item similarity (increase threshold for larger datasets)
         if n_items <= 15000:
             logger.info(f"Computing item similarity matrix ({n_items}x{n_items})...")
-            # Transpose to get items x users
-            item_user_matrix = self.rating_matrix.T.tocsr()
-            self.item_similarity = cosine_similarity(item_user_matrix, dense_output=False)
-            logger.info("Computed full item similarity matrix")
+            # Chỉ giữ top-k neighbors mỗi item, bỏ full matrix sau khi prune
+            self.item_similarity_topk = top_k_per_row(
+                item_user_norm @ item_user_norm.T,
+                self.k_neighbors
+            )
+            logger.info(f"Computed item similarity matrix ({self.item_similarity_topk.nnz} neighbor entries)")
         else:
-            self.item_similarity = None
+            self.item_similarity_topk = None
             logger.warning(f"Dataset too large ({n_items} items) for full similarity matrix, will compute on-demand")
         
         self.is_fitted = True
@@ -98,15 +91,47 @@ class ItemBasedRecommender(BaseRecommender):
         
         return self
     
-    def _get_item_similarities(self, item_idx: int) -> np.ndarray:
-        """Get similarities for a specific item using sparse operations."""
-        if self.item_similarity is not None:
-            # Sử dụng getrow() để lấy sparse row, chỉ convert khi cần
-            return self.item_similarity.getrow(item_idx).toarray().ravel()
-        else:
-            # Compute on-demand với sparse input
-            item_vector = self.rating_matrix.T.getrow(item_idx)
-            return cosine_similarity(item_vector, self.rating_matrix.T).ravel()
+    @staticmethod
+    def _normalized_popularity(item_sums: np.ndarray) -> np.ndarray:
+        """Scale per-item rating sums to 0-1."""
+        if item_sums.size == 0 or item_sums.max() <= 0:
+            return item_sums
+        return item_sums / item_sums.max()
+    
+    def _get_item_popularity(self) -> np.ndarray:
+        """Get the normalized item popularity computed at fit time."""
+        item_popularity = getattr(self, 'item_popularity', None)
+        if item_popularity is None:
+            # Models pickled before popularity was cached
+            item_popularity = self.item_popularity = self._normalized_popularity(
+                np.array(self.rating_matrix.sum(axis=0)).flatten()
+            )
+        return item_popularity
+    
+    def _get_neighbor_matrix(self) -> csr_matrix:
+        """Get the top-k similarity matrix, or None when computed on-demand."""
+        neighbors = getattr(self, 'item_similarity_topk', None)
+        if neighbors is None and getattr(self, 'item_similarity', None) is not None:
+            # Models pickled with the full similarity matrix
+            neighbors = top_k_per_row(self.item_similarity, self.k_neighbors)
+            self.item_similarity = None
+        self.item_similarity_topk = neighbors
+        return neighbors
+    
+    @staticmethod
+    def _normalize_items(rating_matrix: csr_matrix) -> csr_matrix:
+        """Transpose to canonical items x users CSR once and L2-normalize the rows."""
+        item_user_norm = normalize(rating_matrix.T.tocsr(), norm='l2')
+        item_user_norm.sort_indices()
+        return item_user_norm
+    
+    def _get_item_user_norm(self) -> csr_matrix:
+        """Get L2-normalized item vectors (items x users) for on-demand similarity."""
+        item_user_norm = getattr(self, 'item_user_norm', None)
+        if item_user_norm is None:
+            # Models pickled before normalized vectors were stored
+            item_user_norm = self.item_user_norm = self._normalize_items(self.rating_matrix)
+        return item_user_norm
     
     def predict(self, user_id: int, n: int = 20) -> List[int]:
         """
@@ -135,51 +160,25 @@ class ItemBasedRecommender(BaseRecommender):
         if len(rated_indices) == 0:
             return []
         
-        # TốI ƯU QUAN TRỌNG: Đảo ngược logic - iterate qua RATED items
-        # thay vì iterate qua TẤT CẢ items
-        # Độ phức tạp: O(rated × k_neighbors) thay vì O(n_items)
-        n_items = len(self.anime_id_to_idx)
-        predictions = np.zeros(n_items)
-        sim_sums = np.zeros(n_items)
-        
-        rated_set = set(rated_indices)
-        
-        # Với mỗi item user đã rate, tìm similar items và tích lũy
-        for i, rated_idx in enumerate(rated_indices):
-            user_rating = rated_values[i]
-            
-            if self.item_similarity is not None:
-                # Lấy sparse row từ similarity matrix
-                sim_row = self.item_similarity.getrow(rated_idx)
-                similar_indices = sim_row.indices
-                similar_values = sim_row.data
-                
-                # Chỉ lấy top-k neighbors nếu cần
-                if len(similar_indices) > self.k_neighbors:
-                    top_k_positions = similar_values.argsort()[::-1][:self.k_neighbors]
-                    similar_indices = similar_indices[top_k_positions]
-                    similar_values = similar_values[top_k_positions]
-                
-                # Tích lũy weighted sum cho mỗi similar item
-                for j, sim_idx in enumerate(similar_indices):
-                    if sim_idx in rated_set:
-                        continue  # Bỏ qua items đã rate
-                    sim = similar_values[j]
-                    if sim > 0:
-                        predictions[sim_idx] += sim * user_rating
-                        sim_sums[sim_idx] += sim
-            else:
-                # Compute similarity on-demand
-                similarities = self._get_item_similarities(rated_idx)
-                top_k_idx = similarities.argsort()[::-1][:self.k_neighbors]
-                
-                for sim_idx in top_k_idx:
-                    if sim_idx in rated_set:
-                        continue
-                    sim = similarities[sim_idx]
-                    if sim > 0:
-                        predictions[sim_idx] += sim * user_rating
-                        sim_sums[sim_idx] += sim
+        # Top-k neighbors of each rated item (rated items x all items)
+        neighbors = self._get_neighbor_matrix()
+        if neighbors is not None:
+            neighbors = neighbors[rated_indices]
+        else:
+            # Compute similarity on-demand for the rated items only
+            item_user_norm = self._get_item_user_norm()
+            neighbors = top_k_per_row(
+                (item_user_norm @ item_user_norm[rated_indices].T).T,
+                self.k_neighbors
+            )
+        
+        # Weighted sum of the user's ratings and total similarity, one SpMV each
+        predictions = np.asarray(neighbors.T @ rated_values, dtype=np.float32).ravel()
+        sim_sums = np.asarray(neighbors.T @ np.ones(len(rated_indices), dtype=neighbors.dtype), dtype=np.float32).ravel()
+        
+        # Bỏ qua items đã rate
+        predictions[rated_indices] = 0
+        sim_sums[rated_indices] = 0
         
         # Normalize predictions
         valid_mask = sim_sums > 0
@@ -187,9 +186,8 @@ class ItemBasedRecommender(BaseRecommender):
         
         # Add popularity bias to boost popular items (improves P@K)
         if self.popularity_weight > 0:
-            item_popularity = np.array(self.rating_matrix.sum(axis=0)).flatten()
+            item_popularity = self._get_item_popularity()
             if item_popularity.max() > 0:
-                item_popularity = item_popularity / item_popularity.max()  # Normalize 0-1
                 # Blend: (1-weight) * similarity + weight * popularity
                 max_pred = predictions.max() if predictions.max() > 0 else 1.0
                 sim_weight = 1.0 - self.popularity_weight
@@ -197,9 +195,84 @@ class ItemBasedRecommender(BaseRecommender):
         
         # Get top N (exclude items đã rate)
         predictions[rated_indices] = 0
-        top_indices = predictions.argsort()[::-1][:n]
+        top_indices = top_n_indices(predictions, n)
         return [self.idx_to_anime_id[idx] for idx in top_indices if predictions[idx] > 0]
     
+    def predict_batch(self, user_ids: List[int], n: int = 20, batch_size: int = 256) -> List[List[int]]:
+        """
+        Get recommendations for several users with one sparse product per batch.
+        
+        Args:
+            user_ids: User IDs
+            n: Number of recommendations per user
+            batch_size: Users scored together (bounds the dense score block)
+        
+        Returns:
+            List of recommended anime ID lists, aligned with user_ids
+        """
+        if not self.is_fitted:
+            raise RuntimeError("Model not fitted. Call fit() first.")
+        
+        neighbors = self._get_neighbor_matrix()
+        if neighbors is None:
+            # On-demand similarity: score users one at a time
+            return super().predict_batch(user_ids, n)
+        
+        results = {user_id: [] for user_id in user_ids}
+        known = [user_id for user_id in results if user_id in self.user_id_to_idx]
+        
+        item_popularity = self._get_item_popularity()
+        
+        batches = [known[start:start + batch_size] for start in range(0, len(known), batch_size)]
+        if batches:
+            # Sparse products and NumPy ops release the GIL, so blocks score in parallel
+            with ThreadPoolExecutor(max_workers=min(len(batches), os.cpu_count() or 1)) as executor:
+                block_recs = executor.map(
+                    lambda batch: self._recommend_block(batch, n, neighbors, item_popularity),
+                    batches
+                )
+                for batch, recs in zip(batches, block_recs):
+                    results.update(zip(batch, recs))
+        
+        return [results[user_id] for user_id in user_ids]
+    
+    def _recommend_block(
+        self,
+        batch: List[int],
+        n: int,
+        neighbors: csr_matrix,
+        item_popularity: np.ndarray
+    ) -> List[List[int]]:
+        """Score a block of known users with one sparse product and pick each user's top N."""
+        user_matrix = self.rating_matrix[[self.user_id_to_idx[uid] for uid in batch]]
+        rated_matrix = user_matrix.copy()
+        rated_matrix.data[:] = 1
+        rated = user_matrix.nonzero()
+        
+        # Weighted sums and similarity totals for the whole batch (users x items)
+        predictions = np.asarray((user_matrix @ neighbors).toarray(), dtype=np.float32)
+        sim_sums = np.asarray((rated_matrix @ neighbors).toarray(), dtype=np.float32)
+        
+        # Bỏ qua items đã rate
+        predictions[rated] = 0
+        sim_sums[rated] = 0
+        
+        valid_mask = sim_sums > 0
+        predictions[valid_mask] /= sim_sums[valid_mask]
+        
+        # Same popularity blend as predict(), with each user's own max
+        if self.popularity_weight > 0 and item_popularity.max() > 0:
+            max_pred = predictions.max(axis=1, keepdims=True)
+            max_pred[max_pred <= 0] = 1.0
+            blended = (1.0 - self.popularity_weight) * predictions + self.popularity_weight * item_popularity * max_pred
+            predictions = np.where(valid_mask, blended, predictions)
+        
+        recs = []
+        for row in predictions:
+            top_indices = top_n_indices(row, n)
+            recs.append([self.idx_to_anime_id[idx] for idx in top_indices if row[idx] > 0])
+        return recs
+    
     def predict_rating(self, user_id: int, anime_id: int) -> float:
         """
         Predict rating for a user-anime pair.
@@ -221,24 +294,21 @@ class ItemBasedRecommender(BaseRecommender):
         if len(rated_indices) == 0:
             return self.item_means[item_idx]
         
-        # Lấy similarities cho target item
-        similarities = self._get_item_similarities(item_idx)
+        # Similarities của target item tới các items user đã rate: one sparse
+        # product over the rated rows only, not the pruned top-k list
+        item_user_norm = self._get_item_user_norm()
+        rated_sims = (item_user_norm[rated_indices] @ item_user_norm.getrow(item_idx).T).toarray().ravel()
         
         # Tìm top-k similar items mà user đã rate
-        rated_sims = []
-        for i, rated_idx in enumerate(rated_indices):
-            sim = similarities[rated_idx]
-            if sim > 0:
-                rated_sims.append((rated_values[i], sim))
-        
-        rated_sims.sort(key=lambda x: x[1], reverse=True)
-        top_k = rated_sims[:self.k_neighbors]
+        positive = rated_sims > 0
+        rated_sims, rated_values = rated_sims[positive], rated_values[positive]
+        top_k = top_n_indices(rated_sims, self.k_neighbors)
         
-        if not top_k:
+        if len(top_k) == 0:
             return self.item_means[item_idx]
         
-        numerator = sum(sim * rating for rating, sim in top_k)
-        denominator = sum(sim for _, sim in top_k)
+        numerator = float(rated_sims[top_k] @ rated_values[top_k])
+        denominator = float(rated_sims[top_k].sum())
         
         if denominator > 0:
             return numerator / denominator
@@ -4,12 +4,20 @@ Recommends anime based on similar users' preferences.
 """
 
 from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+import os
 import numpy as np
-from scipy.sparse import csr_matrix
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy.sparse import csr_matrix, issparse
+from sklearn.preprocessing import normalize
 import logging
 
-from app.models.base_model import BaseRecommender
+from app.models.base_model import BaseRecommender, build_rating_matrix, top_n_indices
+
+try:
+    import cupy as cp
+    import cupyx.scipy.sparse as cp_sparse
+except ImportError:
+    cp = None  # Optional, GPU similarity falls back to CPU
 
 logger = logging.getLogger(__name__)
 
@@ -19,11 +27,18 @@ class UserBasedRecommender(BaseRecommender):
     User-based collaborative filtering using user-user similarity.
     """
     
-    def __init__(self, k_neighbors: int = 50):
+    neighbor_cache_size = 2048  # on-demand neighbor lists kept per model
+    
+    def __init__(self, k_neighbors: int = 50, use_gpu: bool = False):
         super().__init__("User-Based Collaborative Filtering")
         self.k_neighbors = k_neighbors
+        self.use_gpu = use_gpu  # compute fit-time similarity blocks with CuPy
         self.rating_matrix: csr_matrix = None
         self.user_similarity: np.ndarray = None
+        self.topk_neighbors: np.ndarray = None  # n_users x k neighbor indices, most similar first
+        self.topk_sims: np.ndarray = None
+        self.item_user_norm: csr_matrix = None  # item -> users inverted index of normalized ratings
+        self._neighbor_cache: Dict[int, tuple] = {}
         self.user_id_to_idx: Dict[int, int] = {}
         self.idx_to_user_id: Dict[int, int] = {}
         self.anime_id_to_idx: Dict[int, int] = {}
@@ -42,9 +57,8 @@ class UserBasedRecommender(BaseRecommender):
         """
         logger.info(f"Fitting user-based model with {len(ratings)} ratings")
         
-        # Build user and item mappings
-        users = sorted(set(r['user_id'] for r in ratings))
-        items = sorted(set(r['anime_id'] for r in ratings))
+        # Build sparse rating matrix (users x items) and ID mappings
+        self.rating_matrix, users, items = build_rating_matrix(ratings)
         
         self.user_id_to_idx = {uid: idx for idx, uid in enumerate(users)}
         self.idx_to_user_id = {idx: uid for uid, idx in self.user_id_to_idx.items()}
@@ -52,44 +66,35 @@ class UserBasedRecommender(BaseRecommender):
         self.idx_to_anime_id = {idx: aid for aid, idx in self.anime_id_to_idx.items()}
         
         n_users = len(users)
-        n_items = len(items)
-        
-        # Build sparse rating matrix (users x items)
-        row_indices = []
-        col_indices = []
-        values = []
-        
-        for r in ratings:
-            if r['rating'] > 0:
-                user_idx = self.user_id_to_idx[r['user_id']]
-                item_idx = self.anime_id_to_idx[r['anime_id']]
-                row_indices.append(user_idx)
-                col_indices.append(item_idx)
-                values.append(r['rating'])
-        
-        self.rating_matrix = csr_matrix(
-            (values, (row_indices, col_indices)),
-            shape=(n_users, n_items)
-        )
         
         logger.info(f"Rating matrix shape: {self.rating_matrix.shape}")
         
         # Calculate user means
         user_sums = np.array(self.rating_matrix.sum(axis=1)).flatten()
-        user_counts = np.array((self.rating_matrix > 0).sum(axis=1)).flatten()
+        user_counts = np.diff(self.rating_matrix.indptr)  # only positive ratings are stored
         self.user_means = np.divide(
             user_sums, user_counts,
             out=np.zeros_like(user_sums, dtype=float),
             where=user_counts > 0
         )
         
-        # Calculate user-user similarity (increase threshold for larger datasets)
+        # Normalize once so cosine similarity is a plain dot product
+        user_norm = self._normalize_users(self.rating_matrix)
+        
+        # Neighbors don't change until retrain: keep only each user's top-k
+        # (increase threshold for larger datasets)
+        self.user_similarity = None
+        self._neighbor_cache = {}
         if n_users <= 20000:
-            logger.info(f"Computing user similarity matrix ({n_users}x{n_users})...")
-            self.user_similarity = cosine_similarity(self.rating_matrix, dense_output=False)
-            logger.info("Computed full user similarity matrix")
+            logger.info(f"Computing top-{self.k_neighbors} neighbors for {n_users} users...")
+            self.topk_neighbors, self.topk_sims = self._compute_topk_neighbors(
+                user_norm, self.k_neighbors, use_gpu=getattr(self, 'use_gpu', False)
+            )
+            self.item_user_norm = None
+            logger.info("Computed user neighbor lists")
         else:
-            self.user_similarity = None
+            self.topk_neighbors = self.topk_sims = None
+            self.item_user_norm = self._invert(user_norm)
             logger.warning(f"Dataset too large ({n_users} users) for full similarity matrix, will compute on-demand")
         
         self.is_fitted = True
@@ -97,15 +102,122 @@ class UserBasedRecommender(BaseRecommender):
         
         return self
     
+    @staticmethod
+    def _normalize_users(rating_matrix: csr_matrix) -> csr_matrix:
+        """L2-normalize user rows of the rating matrix."""
+        user_norm = normalize(rating_matrix, norm='l2')
+        user_norm.sort_indices()
+        return user_norm
+    
+    @staticmethod
+    def _invert(user_norm: csr_matrix) -> csr_matrix:
+        """Build the item -> users inverted index (items x users CSR)."""
+        item_user_norm = user_norm.T.tocsr()
+        item_user_norm.sort_indices()
+        return item_user_norm
+    
+    @staticmethod
+    def _compute_topk_neighbors(user_norm: csr_matrix, k: int, block_size: int = 1024,
+                                use_gpu: bool = False):
+        """
+        Find each user's k most similar other users, one row block at a time.
+        
+        Only a block of the user x user similarity is ever materialized per
+        worker thread. With use_gpu the block products run on the GPU via CuPy; neighbor
+        selection stays on the CPU.
+        
+        Returns:
+            Tuple of (neighbor indices, similarities), both n_users x k,
+            ordered by descending similarity
+        """
+        n_users = user_norm.shape[0]
+        k = min(k, n_users - 1)
+        neighbors = np.empty((n_users, k), dtype=np.int32)
+        sims = np.empty((n_users, k), dtype=np.float32)
+        if k <= 0:
+            return neighbors, sims
+        
+        if use_gpu and cp is None:
+            logger.warning("cupy not installed, computing user similarity on CPU. Install with: pip install cupy")
+            use_gpu = False
+        
+        if use_gpu:
+            user_norm = cp_sparse.csr_matrix(user_norm)
+        user_norm_t = user_norm.T.tocsr()
+        
+        def process_block(start: int) -> None:
+            block = (user_norm[start:start + block_size] @ user_norm_t).toarray()
+            if use_gpu:
+                block = cp.asnumpy(block)
+            rows = np.arange(block.shape[0])
+            block[rows, start + rows] = -np.inf  # exclude self
+            
+            idx = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            block_sims = block[rows[:, None], idx]
+            order = np.argsort(-block_sims, axis=1, kind='stable')
+            neighbors[start:start + block_size] = np.take_along_axis(idx, order, axis=1)
+            sims[start:start + block_size] = np.take_along_axis(block_sims, order, axis=1)
+        
+        starts = range(0, n_users, block_size)
+        n_workers = 1 if use_gpu else min(len(starts), os.cpu_count() or 1)
+        if n_workers > 1:
+            # Blocks write disjoint rows; sparse products and partitions release the GIL
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                list(executor.map(process_block, starts))
+        else:
+            for start in starts:
+                process_block(start)
+        
+        return neighbors, sims
+    
+    def _get_item_user_norm(self) -> csr_matrix:
+        """Get the inverted index for on-demand similarity."""
+        item_user_norm = getattr(self, 'item_user_norm', None)
+        if item_user_norm is None:
+            # Models pickled before the inverted index was stored
+            item_user_norm = self.item_user_norm = self._invert(self._normalize_users(self.rating_matrix))
+        return item_user_norm
+    
     def _get_user_similarities(self, user_idx: int) -> np.ndarray:
         """Get similarities for a specific user using sparse operations."""
         if self.user_similarity is not None:
-            # Sử dụng getrow() để lấy sparse row, chỉ convert khi cần
-            return self.user_similarity.getrow(user_idx).toarray().ravel()
+            if issparse(self.user_similarity):
+                # Models pickled with the sparse similarity matrix
+                return self.user_similarity.getrow(user_idx).toarray().ravel()
+            return self.user_similarity[user_idx].astype(np.float32)
         else:
-            # Compute on-demand với sparse input
-            user_vector = self.rating_matrix.getrow(user_idx)
-            return cosine_similarity(user_vector, self.rating_matrix).ravel()
+            # Compute on-demand: accumulate dot products only over users who
+            # share an item with this user, via the item -> users index
+            user_ratings = self.rating_matrix.getrow(user_idx)
+            norm = np.linalg.norm(user_ratings.data)
+            if norm == 0:
+                return np.zeros(self.rating_matrix.shape[0], dtype=np.float32)
+            item_user_norm = self._get_item_user_norm()
+            return (user_ratings.data / norm) @ item_user_norm[user_ratings.indices]
+    
+    def _get_neighbors(self, user_idx: int):
+        """Get a user's top-k neighbor indices and similarities (excluding self)."""
+        topk_neighbors = getattr(self, 'topk_neighbors', None)
+        if topk_neighbors is not None:
+            return topk_neighbors[user_idx], self.topk_sims[user_idx]
+        
+        # On-demand: memoize, since callers often score many items for one user
+        cache = getattr(self, '_neighbor_cache', None)
+        if cache is None:
+            cache = self._neighbor_cache = {}
+        cached = cache.get(user_idx)
+        if cached is not None:
+            return cached
+        
+        similarities = self._get_user_similarities(user_idx)
+        similarities[user_idx] = -np.inf
+        similar_users_idx = top_n_indices(similarities, self.k_neighbors)
+        neighbors = (similar_users_idx, similarities[similar_users_idx])
+        
+        if len(cache) >= self.neighbor_cache_size:
+            del cache[next(iter(cache))]  # evict oldest
+        cache[user_idx] = neighbors
+        return neighbors
     
     def predict(self, user_id: int, n: int = 20) -> List[int]:
         """
@@ -127,48 +239,32 @@ class UserBasedRecommender(BaseRecommender):
         user_idx = self.user_id_to_idx[user_id]
         
         # Sử dụng sparse row trực tiếp - tránh toarray()
-        user_ratings_sparse = self.rating_matrix.getrow(user_idx)
-        rated_items = set(user_ratings_sparse.indices)  # Chỉ lấy non-zero indices
-        
-        # Get similar users
-        similarities = self._get_user_similarities(user_idx)
+        rated_indices = self.rating_matrix.getrow(user_idx).indices
         
-        # Get top-k similar users (excluding self)
-        similar_users_idx = similarities.argsort()[::-1][1:self.k_neighbors + 1]
+        # Get top-k similar users (excluding self), chỉ giữ similarity > 0
+        similar_users_idx, sims = self._get_neighbors(user_idx)
+        sims = sims.astype(float)
+        positive = sims > 0
+        similar_users_idx, sims = similar_users_idx[positive], sims[positive]
         
-        # Aggregate ratings from similar users using sparse operations
-        predictions = {}
+        # Aggregate ratings from similar users: one sparse product each (k x items)
+        neighbor_ratings = self.rating_matrix[similar_users_idx]
+        neighbor_rated = neighbor_ratings.copy()
+        neighbor_rated.data[:] = 1
+        weighted_sum = neighbor_ratings.T @ sims
+        sim_sum = neighbor_rated.T @ sims
         
-        for sim_user_idx in similar_users_idx:
-            sim = similarities[sim_user_idx]
-            if sim <= 0:
-                continue
-            
-            # Sử dụng sparse row thay vì toarray() - tiết kiệm bộ nhớ đáng kể
-            sim_user_sparse = self.rating_matrix.getrow(sim_user_idx)
-            
-            # Iterate chỉ qua non-zero elements (indices và data)
-            for idx, item_idx in enumerate(sim_user_sparse.indices):
-                if item_idx in rated_items:
-                    continue
-                
-                rating = sim_user_sparse.data[idx]
-                if item_idx not in predictions:
-                    predictions[item_idx] = {'weighted_sum': 0.0, 'sim_sum': 0.0}
-                
-                predictions[item_idx]['weighted_sum'] += sim * rating
-                predictions[item_idx]['sim_sum'] += sim
+        # Bỏ qua items đã rate
+        sim_sum[rated_indices] = 0
         
         # Calculate predicted ratings
-        pred_ratings = []
-        for item_idx, data in predictions.items():
-            if data['sim_sum'] > 0:
-                pred = data['weighted_sum'] / data['sim_sum']
-                pred_ratings.append((item_idx, pred))
+        valid_mask = sim_sum > 0
+        pred_ratings = np.zeros(len(sim_sum))
+        pred_ratings[valid_mask] = weighted_sum[valid_mask] / sim_sum[valid_mask]
         
         # Sort by predicted rating and return top N
-        pred_ratings.sort(key=lambda x: x[1], reverse=True)
-        return [self.idx_to_anime_id[idx] for idx, _ in pred_ratings[:n]]
+        top_indices = top_n_indices(pred_ratings, n)
+        return [self.idx_to_anime_id[idx] for idx in top_indices if valid_mask[idx]]
     
     def predict_rating(self, user_id: int, anime_id: int) -> float:
         """
@@ -184,24 +280,46 @@ class UserBasedRecommender(BaseRecommender):
         item_idx = self.anime_id_to_idx[anime_id]
         
         # Get similar users
-        similarities = self._get_user_similarities(user_idx)
-        similar_users_idx = similarities.argsort()[::-1][1:self.k_neighbors + 1]
+        similar_users_idx, sims = self._get_neighbors(user_idx)
         
-        weighted_sum = 0.0
-        sim_sum = 0.0
+        # Neighbors' ratings of this item in one sparse gather (k x 1)
+        # instead of a scalar CSR lookup per neighbor
+        neighbor_ratings = self.rating_matrix[similar_users_idx][:, [item_idx]].toarray().ravel()
+        mask = (sims > 0) & (neighbor_ratings > 0)
         
-        for sim_user_idx in similar_users_idx:
-            sim = similarities[sim_user_idx]
-            if sim <= 0:
-                continue
-            
-            # Truy cập trực tiếp từ sparse matrix - hiệu quả hơn
-            sim_user_rating = self.rating_matrix[sim_user_idx, item_idx]
-            if sim_user_rating > 0:
-                weighted_sum += sim * sim_user_rating
-                sim_sum += sim
-        
-        if sim_sum > 0:
-            return weighted_sum / sim_sum
+        if mask.any():
+            sims = sims[mask].astype(float)
+            return float(sims @ neighbor_ratings[mask] / sims.sum())
         
         return self.user_means[user_idx] if self.user_means[user_idx] > 0 else 5.0
+    
+    def predict_ratings(self, user_id: int, anime_ids: List[int]) -> List[float]:
+        """
+        Predict ratings for several anime of one user.
+        
+        The neighbor lookup and the neighbors' rating rows are fetched once
+        for all items instead of once per item.
+        """
+        if not self.is_fitted or user_id not in self.user_id_to_idx:
+            return [self.predict_rating(user_id, anime_id) for anime_id in anime_ids]
+        
+        user_idx = self.user_id_to_idx[user_id]
+        known = [anime_id for anime_id in anime_ids if anime_id in self.anime_id_to_idx]
+        item_idx = np.array([self.anime_id_to_idx[anime_id] for anime_id in known], dtype=np.intp)
+        
+        # Neighbors x items ratings; non-positive similarities carry no weight
+        similar_users_idx, sims = self._get_neighbors(user_idx)
+        neighbor_ratings = self.rating_matrix[similar_users_idx][:, item_idx].toarray()
+        weights = np.where(sims > 0, sims, 0).astype(float)
+        weighted_sum = weights @ neighbor_ratings
+        sim_sum = weights @ (neighbor_ratings > 0)
+        
+        fallback = self.user_means[user_idx] if self.user_means[user_idx] > 0 else 5.0
+        preds = {
+            anime_id: float(weighted_sum[j] / sim_sum[j]) if sim_sum[j] > 0 else fallback
+            for j, anime_id in enumerate(known)
+        }
+        return [
+            preds[anime_id] if anime_id in preds else self.predict_rating(user_id, anime_id)
+            for anime_id in anime_ids
+        ]
@@ -2,6 +2,6 @@
 Services module initialization.
 """
 
-from app.services.recommendation_service import RecommendationService
+from app.services.recommendation_service import RecommendationService, get_service
 
-__all__ = ["RecommendationService"]
+__all__ = ["RecommendationService", "get_service"]
@@ -4,9 +4,12 @@ Provides recommendation logic using various algorithms.
 """
 
 from typing import List, Optional
+from functools import lru_cache
+import heapq
 import logging
 
-from app.database import Database, Collections, AnimeResponse
+from app.database import get_collections, AnimeResponse, to_anime_response
+from app.utils import async_ttl_cache
 
 logger = logging.getLogger(__name__)
 
@@ -31,13 +34,14 @@ class RecommendationService:
         Returns:
             List of recommended anime
         """
-        db = Database.get_db()
-        ratings_col = db[Collections.RATINGS]
-        animes_col = db[Collections.ANIMES]
+        cols = get_collections()
+        ratings_col = cols.ratings
+        animes_col = cols.animes
         
         # Get user's rated anime
         user_ratings = await ratings_col.find(
-            {"user_id": user_id, "rating": {"$gt": 0}}
+            {"user_id": user_id, "rating": {"$gt": 0}},
+            {"_id": 0, "anime_id": 1, "rating": 1}
         ).to_list(length=1000)
         
         rated_anime_ids = {r["anime_id"] for r in user_ratings}
@@ -48,19 +52,28 @@ class RecommendationService:
         
         # For now, use a simple content-based approach
         # Get genres from user's highly rated anime
+        liked_ratings = [r for r in user_ratings if r["rating"] >= 7]  # Only consider anime rated 7+
+        liked_anime = {}
+        if liked_ratings:
+            # One round-trip for all liked anime instead of a find_one per rating
+            async for anime in animes_col.find(
+                {"anime_id": {"$in": [r["anime_id"] for r in liked_ratings]}},
+                {"_id": 0, "anime_id": 1, "genre": 1}
+            ):
+                liked_anime[anime["anime_id"]] = anime
+        
         liked_genres = {}
-        for rating in user_ratings:
-            if rating["rating"] >= 7:  # Only consider anime rated 7+
-                anime = await animes_col.find_one({"anime_id": rating["anime_id"]})
-                if anime:
-                    for genre in anime.get("genre", []):
-                        liked_genres[genre] = liked_genres.get(genre, 0) + rating["rating"]
+        for rating in liked_ratings:
+            anime = liked_anime.get(rating["anime_id"])
+            if anime:
+                for genre in anime.get("genre", []):
+                    liked_genres[genre] = liked_genres.get(genre, 0) + rating["rating"]
         
         if not liked_genres:
             return await self.get_popular_anime(n)
         
         # Get top genres
-        top_genres = sorted(liked_genres.items(), key=lambda x: x[1], reverse=True)[:5]
+        top_genres = heapq.nlargest(5, liked_genres.items(), key=lambda x: x[1])
         top_genre_names = [g[0] for g in top_genres]
         
         # Find anime with those genres that user hasn't rated
@@ -75,19 +88,7 @@ class RecommendationService:
         ]
         
         cursor = animes_col.aggregate(pipeline)
-        recommendations = []
-        
-        async for anime in cursor:
-            recommendations.append(AnimeResponse(
-                id=str(anime.get("_id")),
-                anime_id=anime.get("anime_id"),
-                name=anime.get("name", ""),
-                genre=anime.get("genre", []),
-                type=anime.get("type", ""),
-                episodes=anime.get("episodes", 0),
-                rating=anime.get("rating", 0.0),
-                members=anime.get("members", 0)
-            ))
+        recommendations = [to_anime_response(anime) async for anime in cursor]
         
         # If not enough recommendations, fill with popular
         if len(recommendations) < n:
@@ -102,6 +103,7 @@ class RecommendationService:
         
         return recommendations
     
+    @async_ttl_cache(ttl=3600, maxsize=1024)
     async def get_similar_anime(
         self,
         anime_id: int,
@@ -109,7 +111,7 @@ class RecommendationService:
     ) -> List[AnimeResponse]:
         """
         Get anime similar to a given anime.
-        Uses genre-based similarity.
+        Uses genre-based similarity. Results are cached for an hour.
         
         Args:
             anime_id: The anime ID to find similar anime for
@@ -118,11 +120,11 @@ class RecommendationService:
         Returns:
             List of similar anime
         """
-        db = Database.get_db()
-        animes_col = db[Collections.ANIMES]
+        cols = get_collections()
+        animes_col = cols.animes
         
         # Get the source anime
-        source = await animes_col.find_one({"anime_id": anime_id})
+        source = await animes_col.find_one({"anime_id": anime_id}, {"_id": 0, "genre": 1})
         if not source:
             raise ValueError(f"Anime with id {anime_id} not found")
         
@@ -148,26 +150,13 @@ class RecommendationService:
         ]
         
         cursor = animes_col.aggregate(pipeline)
-        similar = []
-        
-        async for anime in cursor:
-            similar.append(AnimeResponse(
-                id=str(anime.get("_id")),
-                anime_id=anime.get("anime_id"),
-                name=anime.get("name", ""),
-                genre=anime.get("genre", []),
-                type=anime.get("type", ""),
-                episodes=anime.get("episodes", 0),
-                rating=anime.get("rating", 0.0),
-                members=anime.get("members", 0)
-            ))
-        
-        return similar
+        return [to_anime_response(anime) async for anime in cursor]
     
+    @async_ttl_cache(ttl=3600, maxsize=64)
     async def get_popular_anime(self, n: int = 10) -> List[AnimeResponse]:
         """
         Get popular anime based on rating and members.
-        Used as fallback for cold start users.
+        Used as fallback for cold start users. Results are cached for an hour.
         
         Args:
             n: Number of anime to return
@@ -175,8 +164,8 @@ class RecommendationService:
         Returns:
             List of popular anime
         """
-        db = Database.get_db()
-        animes_col = db[Collections.ANIMES]
+        cols = get_collections()
+        animes_col = cols.animes
         
         # Sort by a combination of rating and popularity (members)
         cursor = animes_col.find(
@@ -186,17 +175,10 @@ class RecommendationService:
             ("members", -1)
         ]).limit(n)
         
-        popular = []
-        async for anime in cursor:
-            popular.append(AnimeResponse(
-                id=str(anime.get("_id")),
-                anime_id=anime.get("anime_id"),
-                name=anime.get("name", ""),
-                genre=anime.get("genre", []),
-                type=anime.get("type", ""),
-                episodes=anime.get("episodes", 0),
-                rating=anime.get("rating", 0.0),
-                members=anime.get("members", 0)
-            ))
-        
-        return popular
+        return [to_anime_response(anime) async for anime in cursor]
+
+
+@lru_cache()
+def get_service() -> RecommendationService:
+    """Get cached recommendation service instance."""
+    return RecommendationService()
@@ -4,10 +4,10 @@ Utils module initialization.
 
 from app.utils.helpers import (
     generate_hash, paginate, format_datetime,
-    safe_divide, chunk_list, merge_dicts
+    safe_divide, chunk_list, merge_dicts, async_ttl_cache, etag_response
 )
 
 __all__ = [
     "generate_hash", "paginate", "format_datetime",
-    "safe_divide", "chunk_list", "merge_dicts"
+    "safe_divide", "chunk_list", "merge_dicts", "async_ttl_cache", "etag_response"
 ]
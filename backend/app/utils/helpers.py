@@ -2,38 +2,55 @@
 Utility functions and helpers.
 """
 
+import asyncio
+import functools
 import hashlib
+import time
+from itertools import islice
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import logging
 
+import orjson
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
 logger = logging.getLogger(__name__)
 
 
 def generate_hash(data: str) -> str:
-    """Generate MD5 hash of a string."""
-    return hashlib.md5(data.encode()).hexdigest()
+    """Generate a 128-bit BLAKE2b hash of a string (non-cryptographic keys)."""
+    return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
 
 
-def paginate(items: List[Any], page: int, page_size: int) -> Dict[str, Any]:
+def paginate(items: Iterable[Any], page: int, page_size: int,
+             total: Optional[int] = None) -> Dict[str, Any]:
     """
-    Paginate a list of items.
+    Paginate a list or iterable of items.
     
     Args:
-        items: List of items to paginate
+        items: Items to paginate; any iterable (e.g. a generator of DB rows) when total is given
         page: Page number (1-indexed)
         page_size: Number of items per page
+        total: Total number of items, if known; avoids materializing items
     
     Returns:
         Dictionary with paginated items and metadata
     """
-    total = len(items)
-    total_pages = (total + page_size - 1) // page_size
     start = (page - 1) * page_size
     end = start + page_size
     
+    if total is None:
+        items = items if isinstance(items, list) else list(items)
+        total = len(items)
+        page_items = items[start:end]
+    else:
+        page_items = list(islice(items, start, end))
+    
+    total_pages = (total + page_size - 1) // page_size
+    
     return {
-        "items": items[start:end],
+        "items": page_items,
         "total": total,
         "page": page,
         "page_size": page_size,
@@ -55,9 +72,10 @@ def safe_divide(numerator: float, denominator: float, default: float = 0.0) -> f
     return numerator / denominator
 
 
-def chunk_list(lst: List[Any], chunk_size: int) -> List[List[Any]]:
-    """Split a list into chunks of specified size."""
-    return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
+def chunk_list(lst: List[Any], chunk_size: int) -> Iterator[List[Any]]:
+    """Lazily split a list into chunks of specified size."""
+    for i in range(0, len(lst), chunk_size):
+        yield lst[i:i + chunk_size]
 
 
 def merge_dicts(*dicts: Dict) -> Dict:
@@ -66,3 +84,79 @@ def merge_dicts(*dicts: Dict) -> Dict:
     for d in dicts:
         result.update(d)
     return result
+
+
+def async_ttl_cache(ttl: float = 60.0, maxsize: Optional[int] = None):
+    """
+    Cache the result of an async function for ``ttl`` seconds.
+    
+    Concurrent callers for the same key share a single computation.
+    Passing ``refresh=True`` bypasses and repopulates the cached entry.
+    
+    Args:
+        ttl: Time-to-live of a cached entry in seconds
+        maxsize: Maximum number of cached entries (oldest evicted first), unbounded if None
+    
+    Returns:
+        Decorator for async functions
+    """
+    def decorator(func: Callable[..., Awaitable[Any]]):
+        cache: Dict[Tuple, Tuple[float, Any]] = {}
+        locks: Dict[Tuple, asyncio.Lock] = {}
+        
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            refresh = kwargs.get("refresh") is True
+            key = (args, tuple(sorted((k, v) for k, v in kwargs.items() if k != "refresh")))
+            
+            if not refresh:
+                entry = cache.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    return entry[1]
+            
+            lock = locks.setdefault(key, asyncio.Lock())
+            async with lock:
+                # Another caller may have populated the entry while we waited
+                if not refresh:
+                    entry = cache.get(key)
+                    if entry is not None and entry[0] > time.monotonic():
+                        return entry[1]
+                
+                result = await func(*args, **kwargs)
+                cache.pop(key, None)
+                if maxsize is not None and len(cache) >= maxsize:
+                    evicted = next(iter(cache))
+                    del cache[evicted]
+                    locks.pop(evicted, None)
+                cache[key] = (time.monotonic() + ttl, result)
+                return result
+        
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    
+    return decorator
+
+
+def etag_response(request: Request, payload: Any, max_age: int = 60) -> Response:
+    """
+    Serialize a payload to JSON with an ETag.
+    Returns 304 Not Modified when the client's If-None-Match already matches.
+    
+    Args:
+        request: Incoming request
+        payload: Response payload (pydantic models, lists, dicts)
+        max_age: Cache-Control max-age in seconds
+    
+    Returns:
+        JSON response, or an empty 304 response
+    """
+    body = orjson.dumps(jsonable_encoder(payload))
+    etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": f"max-age={max_age}"}
+    
+    if_none_match = request.headers.get("if-none-match", "")
+    client_etags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if etag in client_etags:
+        return Response(status_code=304, headers=headers)
+    
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -8,10 +8,15 @@ import asyncio
 import logging
 import random
 from pathlib import Path
+from dataclasses import dataclass
 from datetime import datetime
 from typing import List, Dict, Tuple, Set, Callable, Awaitable, Optional, Any
 from collections import defaultdict
 
+import numpy as np
+
+from pymongo import UpdateOne
+
 from app.database import Database, Collections
 from app.models import (
     ContentBasedRecommender,
@@ -19,7 +24,7 @@ from app.models import (
     UserBasedRecommender,
     HybridRecommender
 )
-from app.evaluation import rmse, mae, precision_at_k, recall_at_k, f1_at_k, ndcg_at_k
+from app.evaluation import rmse, mae, Evaluator
 from app.config import settings
 
 # Configure logging
@@ -36,14 +41,21 @@ async def load_data_from_mongodb():
     
     # Load anime data
     logger.info("Loading anime data from MongoDB...")
-    animes_cursor = db[Collections.ANIMES].find()
+    # Only the fields the models read (content-based keeps these dicts in its pickle)
+    animes_cursor = db[Collections.ANIMES].find(
+        {}, {"_id": 0, "anime_id": 1, "name": 1, "genre": 1, "rating": 1}
+    )
     anime_data = await animes_cursor.to_list(length=50000)
     logger.info(f"Loaded {len(anime_data)} anime records")
     
     # Load ratings data
     logger.info("Loading ratings data from MongoDB...")
-    ratings_cursor = db[Collections.RATINGS].find({"rating": {"$gt": 0}})
-    ratings_data = await ratings_cursor.to_list(length=10000000)
+    ratings_cursor = db[Collections.RATINGS].find(
+        {"rating": {"$gt": 0}},
+        {"_id": 0, "user_id": 1, "anime_id": 1, "rating": 1}
+    )
+    # Stream batch by batch instead of buffering the whole result in to_list()
+    ratings_data = [r async for r in ratings_cursor]
     logger.info(f"Loaded {len(ratings_data)} rating records")
     
     return anime_data, ratings_data
@@ -64,82 +76,121 @@ def train_test_split(ratings: List[Dict], test_ratio: float = 0.2, min_ratings:
     """
     logger.info(f"Splitting data with test_ratio={test_ratio}, min_ratings={min_ratings}")
     
-    # Group ratings by user
-    user_ratings = defaultdict(list)
-    for r in ratings:
-        user_ratings[r['user_id']].append(r)
-    
-    train = []
-    test = []
-    
-    for user_id, user_r in user_ratings.items():
-        if len(user_r) <= min_ratings:
-            # Not enough ratings, all go to train
-            train.extend(user_r)
-        else:
-            # Shuffle and split
-            random.shuffle(user_r)
-            n_test = max(1, int(len(user_r) * test_ratio))
-            n_train = len(user_r) - n_test
-            
-            # Ensure at least min_ratings in train
-            if n_train < min_ratings:
-                n_train = min_ratings
-                n_test = len(user_r) - n_train
-            
-            train.extend(user_r[:n_train])
-            test.extend(user_r[n_train:])
+    # Shuffle within each user's group: sort by user, break ties with random keys
+    user_ids = np.fromiter((r['user_id'] for r in ratings), dtype=np.int64, count=len(ratings))
+    rng = np.random.default_rng()
+    order = np.lexsort((rng.random(len(ratings)), user_ids))
+    _, starts, counts = np.unique(user_ids[order], return_index=True, return_counts=True)
+    
+    # Per-user train size; users with too few ratings go entirely to train
+    n_test = np.maximum(1, (counts * test_ratio).astype(np.int64))
+    n_train = np.where(counts <= min_ratings, counts, np.maximum(counts - n_test, min_ratings))
+    
+    # Rank of each rating inside its (shuffled) user group
+    rank = np.arange(len(order)) - np.repeat(starts, counts)
+    is_test = rank >= np.repeat(n_train, counts)
+    
+    train = [ratings[i] for i in order[~is_test]]
+    test = [ratings[i] for i in order[is_test]]
     
     logger.info(f"Train set: {len(train)} ratings, Test set: {len(test)} ratings")
     return train, test
 
 
-def evaluate_model(
-    model, 
-    test_ratings: List[Dict], 
+@dataclass(frozen=True)
+class EvaluationSet:
+    """Evaluation inputs shared by every model trained on the same split."""
+    user_relevant: Dict[int, List[int]]  # user -> relevant test anime (rating >= threshold)
+    users_to_evaluate: List[int]
+    user_train_items: Dict[int, Set[int]]  # sampled user -> anime rated in train
+    sample_by_user: Dict[int, List[Dict]]  # RMSE/MAE test sample grouped by user
+
+
+def build_evaluation_set(
+    test_ratings: List[Dict],
     train_ratings: List[Dict],
-    k: int = 20,
-    threshold: float = 7.0
-) -> Dict[str, float]:
+    threshold: float = 7.0,
+    max_users: int = 1000,
+    max_ratings: int = 5000
+) -> EvaluationSet:
     """
-    Evaluate a recommendation model.
+    Sample evaluation users and ratings once for all models.
     
     Args:
-        model: Trained recommendation model
         test_ratings: Test set ratings
         train_ratings: Train set ratings (to know what user has seen)
-        k: K for Precision@K, Recall@K
         threshold: Rating threshold for "relevant" items
+        max_users: Maximum number of users for ranking metrics
+        max_ratings: Maximum number of test ratings for RMSE/MAE
     
     Returns:
-        Dictionary of metrics
+        EvaluationSet
     """
-    logger.info(f"Evaluating model with {len(test_ratings)} test ratings...")
-    
-    # Build user -> rated items from train
-    user_train_items = defaultdict(set)
-    for r in train_ratings:
-        user_train_items[r['user_id']].add(r['anime_id'])
-    
     # Build user -> relevant items from test (ratings >= threshold)
     user_relevant = defaultdict(list)
     for r in test_ratings:
         if r['rating'] >= threshold:
             user_relevant[r['user_id']].append(r['anime_id'])
     
+    # Sample users for evaluation (too many users = too slow), skipping cold-start
+    # users with no train history so the budget goes to users models can score
+    train_users = {r['user_id'] for r in train_ratings}
+    users_to_evaluate = [user_id for user_id in user_relevant if user_id in train_users]
+    if len(users_to_evaluate) > max_users:
+        users_to_evaluate = random.sample(users_to_evaluate, max_users)
+    
+    # Build user -> rated items from train, only for the sampled users
+    user_train_items = {user_id: set() for user_id in users_to_evaluate}
+    get_train_items = user_train_items.get  # bound once for the loop over all train ratings
+    for r in train_ratings:
+        items = get_train_items(r['user_id'])
+        if items is not None:
+            items.add(r['anime_id'])
+    
+    # Rating prediction sample: draw positions only (O(sample size)), then read
+    # those ratings in place, grouped by user so per-user work is done once
+    sample_idx = np.random.default_rng().choice(
+        len(test_ratings), size=min(max_ratings, len(test_ratings)), replace=False
+    )
+    sample_by_user = defaultdict(list)
+    for i in sample_idx:
+        r = test_ratings[i]
+        sample_by_user[r['user_id']].append(r)
+    
+    logger.info(f"Evaluation set: {len(users_to_evaluate)} users, {len(sample_idx)} sampled ratings")
+    return EvaluationSet(dict(user_relevant), users_to_evaluate, user_train_items, dict(sample_by_user))
+
+
+def evaluate_model(model, eval_set: EvaluationSet, k: int = 20) -> Dict[str, float]:
+    """
+    Evaluate a recommendation model.
+    
+    Args:
+        model: Trained recommendation model
+        eval_set: Shared evaluation users and samples (see build_evaluation_set)
+        k: K for Precision@K, Recall@K
+    
+    Returns:
+        Dictionary of metrics
+    """
+    logger.info(f"Evaluating model on {len(eval_set.users_to_evaluate)} users...")
+    user_relevant = eval_set.user_relevant
+    users_to_evaluate = eval_set.users_to_evaluate
+    user_train_items = eval_set.user_train_items
+    
     # Collect predictions for RMSE/MAE
     rating_predictions = []
     
-    # Collect recommendations for Precision/Recall
-    all_precisions = []
-    all_recalls = []
-    all_f1s = []
-    all_ndcgs = []
+    # Collect recommendations for Precision/Recall (scored together below)
+    user_recommendations = {}
     
-    # Sample users for evaluation (too many users = too slow)
-    users_to_evaluate = list(user_relevant.keys())
-    if len(users_to_evaluate) > 1000:
-        users_to_evaluate = random.sample(users_to_evaluate, 1000)
+    # Score all sampled users together when the model supports batching
+    batch_recs = {}
+    if not isinstance(model, ContentBasedRecommender):
+        try:
+            batch_recs = dict(zip(users_to_evaluate, model.predict_batch(users_to_evaluate, n=k)))
+        except Exception as e:
+            logger.warning(f"Batch prediction failed, falling back to per-user: {e}")
     
     for user_id in users_to_evaluate:
         relevant = user_relevant[user_id]
@@ -156,143 +207,155 @@ def evaluate_model(
                          # Fallback if no history (should be handled by filters but safety check)
                          continue
                      recs = model.predict(user_id, n=k, liked_anime_ids=liked)
+                elif user_id in batch_recs:
+                    recs = batch_recs[user_id]
                 else:
                     recs = model.predict(user_id, n=k)
             else:
                 continue
             
             if recs:
-                # Calculate ranking metrics
-                all_precisions.append(precision_at_k(recs, relevant, k))
-                all_recalls.append(recall_at_k(recs, relevant, k))
-                all_f1s.append(f1_at_k(recs, relevant, k))
-                all_ndcgs.append(ndcg_at_k(recs, relevant, k))
+                user_recommendations[user_id] = recs
         except Exception as e:
             continue
     
     # Calculate rating prediction accuracy (sample)
-    test_sample = random.sample(test_ratings, min(5000, len(test_ratings)))
-    for r in test_sample:
+    for user_id, user_sample in eval_set.sample_by_user.items():
         try:
-            pred = model.predict_rating(r['user_id'], r['anime_id'])
-            rating_predictions.append((r['rating'], pred))
+            preds = model.predict_ratings(user_id, [r['anime_id'] for r in user_sample])
+            rating_predictions.extend((r['rating'], pred) for r, pred in zip(user_sample, preds))
         except Exception:
-            continue
+            # Fall back to per-rating predictions, skipping the ones that fail
+            for r in user_sample:
+                try:
+                    rating_predictions.append((r['rating'], model.predict_rating(user_id, r['anime_id'])))
+                except Exception:
+                    continue
+    
+    # Ranking metrics for all evaluated users as (users x k) array ops
+    ranking = Evaluator(k=k).evaluate_recommendations(user_recommendations, user_relevant)
     
     # Calculate metrics
     metrics = {
-        'rmse': round(rmse(rating_predictions), 4) if rating_predictions else 0.0,
-        'mae': round(mae(rating_predictions), 4) if rating_predictions else 0.0,
-        'precision_k': round(sum(all_precisions) / len(all_precisions), 4) if all_precisions else 0.0,
-        'recall_k': round(sum(all_recalls) / len(all_recalls), 4) if all_recalls else 0.0,
-        'f1_k': round(sum(all_f1s) / len(all_f1s), 4) if all_f1s else 0.0,
-        'ndcg_k': round(sum(all_ndcgs) / len(all_ndcgs), 4) if all_ndcgs else 0.0,
+        'rmse': rmse(rating_predictions) if rating_predictions else 0.0,
+        'mae': mae(rating_predictions) if rating_predictions else 0.0,
+        'precision_k': ranking[f'precision@{k}'],
+        'recall_k': ranking[f'recall@{k}'],
+        'f1_k': ranking[f'f1@{k}'],
+        'ndcg_k': ranking[f'ndcg@{k}'],
     }
     
-    logger.info(f"Metrics: RMSE={metrics['rmse']}, MAE={metrics['mae']}, "
-                f"P@{k}={metrics['precision_k']}, R@{k}={metrics['recall_k']}")
+    logger.info(f"Metrics: RMSE={metrics['rmse']:.4f}, MAE={metrics['mae']:.4f}, "
+                f"P@{k}={metrics['precision_k']:.4f}, R@{k}={metrics['recall_k']:.4f}")
     
     return metrics
 
 
-async def save_metrics_to_mongodb(model_name: str, metrics: dict, description: str):
-    """Save model metrics to MongoDB."""
+async def save_metrics_to_mongodb(results: List[Tuple[str, Dict[str, float], str]]):
+    """Save (model_name, metrics, description) records to MongoDB in one bulk upsert."""
+    if not results:
+        return
+    
     db = Database.get_db()
     metrics_col = db[Collections.MODEL_METRICS]
-    
-    doc = {
-        "model_name": model_name,
-        "trained_at": datetime.utcnow(),
-        "rmse": metrics.get('rmse', 0),
-        "mae": metrics.get('mae', 0),
-        "precision_k": metrics.get('precision_k', 0),
-        "recall_k": metrics.get('recall_k', 0),
-        "f1_k": metrics.get('f1_k', 0),
-        "ndcg_k": metrics.get('ndcg_k', 0),
-        "description": description
-    }
-    
-    # Upsert
-    await metrics_col.update_one(
-        {"model_name": model_name},
-        {"$set": doc},
-        upsert=True
-    )
-    logger.info(f"Saved metrics for {model_name} to MongoDB")
+    trained_at = datetime.utcnow()
+    
+    operations = []
+    for model_name, metrics, description in results:
+        # Metrics are kept at full precision until stored
+        doc = {
+            "model_name": model_name,
+            "trained_at": trained_at,
+            "rmse": round(metrics.get('rmse', 0), 4),
+            "mae": round(metrics.get('mae', 0), 4),
+            "precision_k": round(metrics.get('precision_k', 0), 4),
+            "recall_k": round(metrics.get('recall_k', 0), 4),
+            "f1_k": round(metrics.get('f1_k', 0), 4),
+            "ndcg_k": round(metrics.get('ndcg_k', 0), 4),
+            "description": description
+        }
+        # Upsert
+        operations.append(UpdateOne({"model_name": model_name}, {"$set": doc}, upsert=True))
+    
+    await metrics_col.bulk_write(operations, ordered=False)
+    logger.info(f"Saved metrics for {', '.join(r[0] for r in results)} to MongoDB")
+
 
 
+def fit_and_evaluate(model, fit_args: tuple, model_path: Path, eval_set: EvaluationSet) -> Dict[str, float]:
+    """
+    Fit, save and evaluate a model.
+    Blocking; the train_* coroutines run it in a worker thread so models
+    train concurrently and the event loop stays responsive.
+    """
+    model.fit(*fit_args)
+    model.save(model_path)
+    return evaluate_model(model, eval_set)
+
 
-async def train_content_based(save_path: Path, anime_list: List[Dict], train_ratings: List[Dict], test_ratings: List[Dict]):
+async def train_content_based(save_path: Path, anime_list: List[Dict], train_ratings: List[Dict], eval_set: EvaluationSet):
     """Train and evaluate Content-Based model."""
     logger.info("\n" + "=" * 40)
     logger.info("TRAINING CONTENT-BASED FILTERING")
     logger.info("=" * 40)
     
-    content_model = ContentBasedRecommender()
-    content_model.fit(anime_list)
-    content_model.save(save_path / "content_based.pkl")
-    
-    content_metrics = evaluate_model(content_model, test_ratings, train_ratings)
-    await save_metrics_to_mongodb(
-        "Content-Based Filtering", 
+    content_metrics = await asyncio.to_thread(
+        fit_and_evaluate, ContentBasedRecommender(), (anime_list,),
+        save_path / "content_based.pkl", eval_set
+    )
+    return (
+        "Content-Based Filtering",
         content_metrics,
         "Recommends based on anime features (genres) using TF-IDF and cosine similarity"
     )
-    return content_metrics
 
-async def train_item_based(save_path: Path, train_ratings: List[Dict], test_ratings: List[Dict]):
+async def train_item_based(save_path: Path, train_ratings: List[Dict], eval_set: EvaluationSet):
     """Train and evaluate Item-Based CF model."""
     logger.info("\n" + "=" * 40)
     logger.info("TRAINING ITEM-BASED COLLABORATIVE FILTERING")
     logger.info("=" * 40)
     
-    item_model = ItemBasedRecommender(k_neighbors=20)
-    item_model.fit(train_ratings)
-    item_model.save(save_path / "item_based.pkl")
-    
-    item_metrics = evaluate_model(item_model, test_ratings, train_ratings)
-    await save_metrics_to_mongodb(
+    item_metrics = await asyncio.to_thread(
+        fit_and_evaluate, ItemBasedRecommender(k_neighbors=20), (train_ratings,),
+        save_path / "item_based.pkl", eval_set
+    )
+    return (
         "Item-Based Collaborative Filtering",
         item_metrics,
         "Recommends based on item-item similarity using user rating patterns"
     )
-    return item_metrics
 
-async def train_user_based(save_path: Path, train_ratings: List[Dict], test_ratings: List[Dict]):
+async def train_user_based(save_path: Path, train_ratings: List[Dict], eval_set: EvaluationSet):
     """Train and evaluate User-Based CF model."""
     logger.info("\n" + "=" * 40)
     logger.info("TRAINING USER-BASED COLLABORATIVE FILTERING")
     logger.info("=" * 40)
     
-    user_model = UserBasedRecommender(k_neighbors=20)
-    user_model.fit(train_ratings)
-    user_model.save(save_path / "user_based.pkl")
-    
-    user_metrics = evaluate_model(user_model, test_ratings, train_ratings)
-    await save_metrics_to_mongodb(
+    user_metrics = await asyncio.to_thread(
+        fit_and_evaluate, UserBasedRecommender(k_neighbors=20), (train_ratings,),
+        save_path / "user_based.pkl", eval_set
+    )
+    return (
         "User-Based Collaborative Filtering",
         user_metrics,
         "Recommends based on similar user preferences using KNN"
     )
-    return user_metrics
 
-async def train_hybrid(save_path: Path, anime_list: List[Dict], train_ratings: List[Dict], test_ratings: List[Dict]):
+async def train_hybrid(save_path: Path, anime_list: List[Dict], train_ratings: List[Dict], eval_set: EvaluationSet):
     """Train and evaluate Hybrid model."""
     logger.info("\n" + "=" * 40)
     logger.info("TRAINING HYBRID MODEL")
     logger.info("=" * 40)
     
-    hybrid_model = HybridRecommender()
-    hybrid_model.fit(anime_list, train_ratings)
-    hybrid_model.save(save_path / "hybrid.pkl")
-    
-    hybrid_metrics = evaluate_model(hybrid_model, test_ratings, train_ratings)
-    await save_metrics_to_mongodb(
+    hybrid_metrics = await asyncio.to_thread(
+        fit_and_evaluate, HybridRecommender(), (anime_list, train_ratings),
+        save_path / "hybrid.pkl", eval_set
+    )
+    return (
         "Hybrid Model",
         hybrid_metrics,
         "Combines Content-Based and Collaborative Filtering with weighted scoring"
     )
-    return hybrid_metrics
 
 
 
@@ -328,20 +391,20 @@ async def train_models_task(model_name: str = None, progress_callback: Optional[
         
         await report("Loading data from database...", 5)
         
-        # Load data
-        anime_data, ratings_data = await load_data_from_mongodb()
+        # Load data (Motor already returns plain dicts, used as-is)
+        anime_list, ratings_list = await load_data_from_mongodb()
         
-        if not anime_data or not ratings_data:
+        if not anime_list or not ratings_list:
             logger.error("No data found for training!")
             await report("Error: No data found", 0)
             return
-
-        anime_list = [dict(a) for a in anime_data]
-        ratings_list = [dict(r) for r in ratings_data]
         
         await report("Splitting datasets...", 10)
         train_ratings, test_ratings = train_test_split(ratings_list, test_ratio=0.2)
         
+        # Same users and samples for every model: computed once, comparable metrics
+        eval_set = build_evaluation_set(test_ratings, train_ratings)
+        
         # Map model names to functions
         # Allow loose matching or specific keys
         run_all = model_name is None or model_name.lower() == "all"
@@ -355,30 +418,36 @@ async def train_models_task(model_name: str = None, progress_callback: Optional[
         if run_all or "hybrid" in target_model: steps.append("hybrid")
         
         total_steps = len(steps)
-        current_step = 0
+        completed_steps = 0
         base_progress = 15
         progress_per_step = 80 / max(total_steps, 1)
-
-        if run_all or "content" in target_model:
-            await report("Training Content-Based Model...", int(base_progress + current_step * progress_per_step))
-            await train_content_based(save_path, anime_list, train_ratings, test_ratings)
-            current_step += 1
-            
-        if run_all or "item" in target_model:
-            await report("Training Item-Based CF Model...", int(base_progress + current_step * progress_per_step))
-            await train_item_based(save_path, train_ratings, test_ratings)
-            current_step += 1
-            
-        if run_all or "user" in target_model:
-            await report("Training User-Based CF Model...", int(base_progress + current_step * progress_per_step))
-            await train_user_based(save_path, train_ratings, test_ratings)
-            current_step += 1
-            
-        if run_all or "hybrid" in target_model:
-            await report("Training Hybrid Model...", int(base_progress + current_step * progress_per_step))
-            await train_hybrid(save_path, anime_list, train_ratings, test_ratings)
-            current_step += 1
-            
+        
+        jobs = {
+            "content": ("Content-Based", lambda: train_content_based(save_path, anime_list, train_ratings, eval_set)),
+            "item": ("Item-Based CF", lambda: train_item_based(save_path, train_ratings, eval_set)),
+            "user": ("User-Based CF", lambda: train_user_based(save_path, train_ratings, eval_set)),
+            "hybrid": ("Hybrid", lambda: train_hybrid(save_path, anime_list, train_ratings, eval_set)),
+        }
+        
+        async def run_step(step: str):
+            nonlocal completed_steps
+            label, train = jobs[step]
+            result = await train()
+            completed_steps += 1
+            await report(f"Trained {label} Model ({completed_steps}/{total_steps})",
+                         int(base_progress + completed_steps * progress_per_step))
+            return result
+        
+        # Models are independent (hybrid fits its own sub-models), so train them concurrently
+        await report(f"Training {total_steps} models...", base_progress)
+        outcomes = await asyncio.gather(*(run_step(step) for step in steps), return_exceptions=True)
+        
+        # Save metrics of every model that finished, even if another one failed
+        await save_metrics_to_mongodb([o for o in outcomes if not isinstance(o, BaseException)])
+        for outcome in outcomes:
+            if isinstance(outcome, BaseException):
+                raise outcome
+        
         await report("Retraining completed successfully!", 100)
         logger.info("Retraining task completed successfully.")
         